@@ -1,16 +1,22 @@
-import os, re, sqlite3, logging, copy
+import os, sys, re, sqlite3, logging, json, time, shutil, glob, hashlib, argparse, urllib.request
+import cProfile, tracemalloc, threading, queue, zlib, logging.handlers
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Mapping
 
 if not 'ExportSQLiteError' in dir():
     ExportSQLiteError = ImportError
 
+@dataclass(frozen=True, slots=True)
 class ColInfo:
-    def __init__(self, cid : int, name : str, type: str, notNull: bool, defaultValue: str, isPrimaryKey : bool):
-        self.cid = cid
-        self.name = name
-        self.type = type
-        self.notNull = notNull
-        self.defaultValue = defaultValue
-        self.isPrimaryKey = isPrimaryKey
+    cid : int
+    name : str
+    type : str
+    notNull : bool
+    defaultValue : str
+    isPrimaryKey : bool
 
     def diff(self, other : 'ColInfo' ) -> list[str]:
         diffList : list[str] = []
@@ -28,44 +34,315 @@ class ColInfo:
             diffList.append(f'isPrimaryKey: {self.isPrimaryKey} <> {other.isPrimaryKey}')
         return diffList
 
+@dataclass(frozen=True, slots=True)
+class ForeignKeyInfo:
+    id : int
+    referencedTable : str
+    colNames : tuple[str, ...]
+    referencedColNames : tuple[str, ...]
+    onUpdate : str
+    onDelete : str
+
+# immutable, so table infos can be shared between strategies without copying
+@dataclass(frozen=True, slots=True)
 class TableInfo:
-    def __init__(self, name : str, colInfoByIdx : dict[int, ColInfo], containsData : bool ):
-        self.name = name
-        self.containsData = containsData
-        self.colInfoByIdx = colInfoByIdx
-        self.colInfoByName : dict[str,ColInfo] = {}
-        for idx,colInfo in sorted(self.colInfoByIdx.items()):
-            self.colInfoByName[colInfo.name] = colInfo
+    name : str
+    colInfos : tuple[ColInfo, ...]
+    containsData : bool
+    foreignKeys : tuple[ForeignKeyInfo, ...] = ()
+    colInfoByName : Mapping[str, ColInfo] = field(init=False, repr=False, compare=False)
+    # column names in table order, used to find renamed tables
+    fingerprint : tuple[str, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'colInfos', tuple(self.colInfos))
+        object.__setattr__(self, 'foreignKeys', tuple(self.foreignKeys))
+        object.__setattr__(self, 'colInfoByName',
+                           MappingProxyType({colInfo.name: colInfo for colInfo in self.colInfos}))
+        object.__setattr__(self, 'fingerprint', tuple(self.colInfoByName))
 
     def diff(self, other : 'TableInfo' ) -> list[str]:
         diffList : list[str] = []
         if self.name != other.name:
             diffList.append(f'table name: "{self.name}" <> "{other.name}"')
 
-        names = list(self.colInfoByName.keys())
-        otherNames = list(other.colInfoByName.keys())
-        allNames = list(otherNames)
-        for name in names:
-            if not name in allNames:
-                allNames.append(name)
+        colInfoByName = self.colInfoByName
+        otherColInfoByName = other.colInfoByName
+        allNames = list(otherColInfoByName)
+        allNames.extend(name for name in colInfoByName if name not in otherColInfoByName)
 
         for colName in allNames:
-            if colName not in names:
+            if colName not in colInfoByName:
                 diffList.append(f'col "{colName}" not in table "{self.name}"')
-            elif colName not in otherNames:
+            elif colName not in otherColInfoByName:
                 diffList.append(f'col "{colName}" not in table "{other.name}"')
             else:
-                diff = self.colInfoByName[colName].diff(other.colInfoByName[colName]) 
+                diff = colInfoByName[colName].diff(otherColInfoByName[colName])
                 if len(diff):
                     diffList.append(f'col "{colName}": {",".join(diff)}')
         return diffList
 
+# restore plan of a single table, data of table oldTableName will be restored into table newTableName
+@dataclass(slots=True)
+class TableRestorePlan:
+    oldTableName : str
+    newTableName : str
+    strategy : str  # 'RowByRow' or 'RowByNamedColumns'
+    reason : str
+    # restored columns, old column name -> new column name
+    columnMapping : dict[str, str]
+    renamedColumns : dict[str, str] = field(default_factory=dict)
+    columnsChanged : bool = False
+    changedTypeColumns : list[str] = field(default_factory=list)
+    # sql expressions applied while restoring, new column name -> expression
+    transformations : dict[str, str] = field(default_factory=dict)
+    # old column names of columns with large blobs, which are copied incrementally
+    streamedColumns : list[str] = field(default_factory=list)
+    # old column names or rowid the rows are dumped ordered by
+    orderBy : list[str] = field(default_factory=list)
+    estimatedRows : int = 0
+    estimatedBytes : int = 0
+    estimatedSeconds : float = 0.0
+    oldTableInfo : TableInfo | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def label(self) -> str:
+        return f'{self.strategy}({self.reason})'
+
+    def toDict(self) -> dict:
+        return { name: getattr(self, name) if name not in ('columnMapping', 'transformations')
+                       else dict(getattr(self, name))
+                 for name in self.__dataclass_fields__ if name != 'oldTableInfo' }
+
+# describes how an update will dump/restore the data of an existing database
+@dataclass(slots=True)
+class RestorePlan:
+    dbPath : str
+    tables : dict[str, TableRestorePlan] = field(default_factory=dict)
+    renamingTableNames : dict[str, str] = field(default_factory=dict)
+    renamingTableCols : dict[str, dict[str, str]] = field(default_factory=dict)
+    droppedTables : list[str] = field(default_factory=list)
+    createdTables : list[str] = field(default_factory=list)
+    throughput : float = 0.0  # bytes per second used for estimation
+
+    @property
+    def estimatedRows(self) -> int:
+        return sum(tablePlan.estimatedRows for tablePlan in self.tables.values())
+
+    @property
+    def estimatedBytes(self) -> int:
+        return sum(tablePlan.estimatedBytes for tablePlan in self.tables.values())
+
+    @property
+    def estimatedSeconds(self) -> float:
+        return sum(tablePlan.estimatedSeconds for tablePlan in self.tables.values())
+
+    def toDict(self) -> dict:
+        planDict = { name: getattr(self, name) for name in self.__dataclass_fields__ }
+        planDict['tables'] = { name: tablePlan.toDict() for name, tablePlan in self.tables.items() }
+        planDict['estimatedRows'] = self.estimatedRows
+        planDict['estimatedBytes'] = self.estimatedBytes
+        planDict['estimatedSeconds'] = self.estimatedSeconds
+        return planDict
+
+    def toJson(self, indent : int | None = 2) -> str:
+        return json.dumps(self.toDict(), indent=indent, ensure_ascii=False)
+
+# placeholder for a large blob in the dump, the blob is copied incrementally after restoring
+class ZeroBlob(int):
+    pass
+
+# cursor which time stamps the end of its statement, when it has been executed and when rows are fetched
+class TracedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        try:
+            return super().execute(*args)
+        finally:
+            self.connection.stampTrace()
+
+    # statements of executemany and executescript run one after the other, each one ends with the start of the
+    # next one
+    def executemany(self, *args):
+        self.connection.inBatch = True
+        try:
+            return super().executemany(*args)
+        finally:
+            self.connection.inBatch = False
+            self.connection.stampTrace()
+
+    def executescript(self, *args):
+        self.connection.inBatch = True
+        try:
+            return super().executescript(*args)
+        finally:
+            self.connection.inBatch = False
+            self.connection.stampTrace()
+
+    def __next__(self):
+        try:
+            return super().__next__()
+        finally:
+            self.connection.stampTrace()
+
+    def fetchone(self):
+        try:
+            return super().fetchone()
+        finally:
+            self.connection.stampTrace()
+
+    def fetchmany(self, *args):
+        try:
+            return super().fetchmany(*args)
+        finally:
+            self.connection.stampTrace()
+
+    def fetchall(self):
+        try:
+            return super().fetchall()
+        finally:
+            self.connection.stampTrace()
+
+# connection of traced cursors, which finishes the trace of its last statement when closed
+class TracedConnection(sqlite3.Connection):
+    inBatch = False
+
+    def stampTrace(self):
+        pass
+
+    def finishTrace(self):
+        pass
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+    def close(self):
+        self.finishTrace()
+        super().close()
+
+# traces the statements of connections, the duration of a statement is measured from its start by the trace
+# callback until it has been executed or its last row has been fetched, statements slower than slowSeconds are
+# written truncated to the slow statement log
+class SqlTracer:
+    tableNameRe = re.compile( r'\b(?:INTO|FROM|UPDATE|TABLE|ON|VIEW|ANALYZE)\s+(?:"[^"]*"\.)?"?([^"\s(),;]+)',
+                              re.IGNORECASE )
+
+    def __init__(self, slowLogPath : str, slowSeconds : float = 1.0, maxSqlLength : int = 200):
+        self.slowLogPath = slowLogPath
+        self.slowSeconds = slowSeconds
+        self.maxSqlLength = maxSqlLength
+        self.statementCount = 0
+        self.seconds = 0.0
+        self.slowStatements : list[tuple[float, str, str]] = []
+        self.lock = threading.Lock()
+        self.slowLog = open(slowLogPath, 'wt', encoding='utf8')
+
+    @property
+    def closed(self) -> bool:
+        return self.slowLog.closed
+
+    def attach(self, conn : TracedConnection):
+        current = { 'sql': None, 'start': 0.0, 'end': 0.0 }
+
+        def stampTrace():
+            current['end'] = time.perf_counter()
+
+        def finishTrace():
+            if current['sql'] is not None:
+                self.record( current['sql'], current['end'] - current['start'] )
+                current['sql'] = None
+
+        def trace(sql):
+            # statements of triggers and virtual tables are part of the running statement
+            if sql.startswith('--'):
+                return
+            if conn.inBatch:
+                stampTrace()
+            finishTrace()
+            current['start'] = current['end'] = time.perf_counter()
+            current['sql'] = sql
+
+        conn.stampTrace = stampTrace
+        conn.finishTrace = finishTrace
+        conn.set_trace_callback(trace)
+
+    def record(self, sql : str, seconds : float):
+        with self.lock:
+            self.statementCount += 1
+            self.seconds += seconds
+            if seconds < self.slowSeconds or self.slowLog.closed:
+                return
+            match = SqlTracer.tableNameRe.search(sql[:1000])
+            tableName = match.group(1) if match else ''
+            text = ' '.join(sql[:self.maxSqlLength * 2].split())[:self.maxSqlLength]
+            self.slowStatements.append( (seconds, tableName, text) )
+            self.slowLog.write( f'{seconds:.3f}s [{tableName}] {text}\n' )
+
+    def close(self):
+        with self.lock:
+            self.slowLog.close()
+
+# keeps the formatted text of the latest records, warnings and errors are pinned until maxPinned is reached
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity : int = 1000, maxPinned : int = 200, level : int = logging.NOTSET):
+        super().__init__(level)
+        self.records : deque[str] = deque(maxlen=capacity)
+        self.pinned : list[str] = []
+        self.maxPinned = maxPinned
+        self.count = 0
+
+    def emit(self, record : logging.LogRecord):
+        msg = self.format(record)
+        self.count += 1
+        self.records.append(msg)
+        if record.levelno >= logging.WARNING and len(self.pinned) < self.maxPinned:
+            self.pinned.append(msg)
+
+    def getText(self) -> str:
+        with self.lock:
+            lines = []
+            omitted = self.count - len(self.records)
+            if omitted > 0:
+                pinned = [ msg for msg in self.pinned if msg not in self.records ]
+                if len(pinned):
+                    lines += [ 'Warnings and errors of omitted records:' ] + pinned + [ '' ]
+                lines.append( f'... {omitted} earlier records omitted, see log file' )
+            lines += list(self.records)
+            return '\n'.join(lines) + '\n' if len(lines) else ''
+
 class SQLiteDbUpdater:
+    # used for duration estimation as long as no throughput was measured
+    defaultThroughput = 10 * 1024 * 1024
+    # size of the data dump in relation to the size of the db, used for the free space preflight
+    dumpSizeFactor = 2.0
+    # rows per INSERT statement of the data dump
+    dumpBatchSize = 1000
+    # blobs larger than this are not dumped but copied incrementally in chunks of blobChunkSize
+    blobStreamThreshold = 1024 * 1024
+    blobChunkSize = 1024 * 1024
+    # table and trigger name prefix for capturing changes of the old db
+    captureTableName = 'SQLiteDbUpdaterCapture'
+
     # create update using path for database to update/create and sql script for creating
-    def __init__(self, dbPath : str, createDbSql : str ) -> None:
+    # the temporary db will be created in tmpDir, dump files are written to dumpDir, both default to the db directory
+    def __init__(self, dbPath : str, createDbSql : str, tmpDir : str | None = None,
+                 dumpDir : str | None = None ) -> None:
         self.dbPath = dbPath
         self.createDbSql = createDbSql
+        self.createDbSqlFile = None
         self.logger = None
+        self.logHandler = None
+        self.logListener = None
+        self.logFileHandler = None
+        self.logPropagate = True
         self.dbFileName = os.path.basename(self.dbPath)
         self.dbName = os.path.splitext(self.dbFileName)[0]
         self.dbTmpFileName = self.dbFileName + "~"
@@ -73,56 +350,329 @@ class SQLiteDbUpdater:
         self.dbRestoreViewsFileName = self.dbName + "_restoreViews.sql"
         self.dbOrigDefinitionFileName =  self.dbName + "_orig_definition.sql"
         self.dbDefinitionFileName =  self.dbName + "_definition.sql"
+        self.dbThroughputFileName =  self.dbName + "_throughput.json"
         self.confirmRequestCallback = None
-        self.workDir = os.path.dirname( dbPath )
+        self.workDir = os.path.dirname( os.path.abspath(dbPath) )
+        self.tmpDir = tmpDir
+        self.dumpDir = dumpDir
         self.logFile = os.path.join( self.workDir, self.dbName + ".log" )
         self.dbTableInfo = {}
+        # compare row count and checksum of restored tables before replacing the db
+        self.verifyData = False
+        self.verifyWorkers = 4
+        # check foreign keys of tables with changed data or foreign key definitions after restoring
+        self.checkForeignKeys = False
+        self.foreignKeyViolations : list[dict] = []
+        # carry over planner statistics of unchanged tables, analyze the other ones
+        self.analyze = False
+        self.analysisLimit = 1000
+        # sql expressions evaluated while restoring, new table name -> new column name -> expression,
+        # the expression refers to the restored values by the new column names, e.g.
+        # { 'participant': { 'birthday': "strftime('%Y-%m-%d', birthday)" } }
+        self.columnTransformations : dict[str, dict[str, str]] = {}
+        # python scalar functions usable in columnTransformations, function name -> callable
+        self.sqlFunctions : dict[str, Callable] = {}
+        # dump rows in key order of the new tables, so the b-tree pages are filled sequentially
+        self.orderByKey = False
+        # profile each phase of update by cProfile and tracemalloc, results are written next to the log
+        self.profile = False
+        self.profileTopN = 25
+        self.phasePeakMemory : dict[str, int] = {}
+        # trace all sql statements, statements slower than slowStatementSeconds are written to <db>_slow.log
+        self.traceSql = False
+        self.slowStatementSeconds = 1.0
+        self.dbSlowLogFileName = self.dbName + "_slow.log"
+        self.sqlTracer : SqlTracer | None = None
+        # if no table has changed, indexes, views and triggers are updated in the existing db without rebuilding it
+        self.inPlace = False
+        # 'replace' renames the temporary db to the db, 'backup' copies it into the db by the backup api,
+        # so applications may keep the db open, busy dbs are retried publishRetries times
+        self.publishMode = 'replace'
+        self.busyTimeout = 5000
+        self.publishRetries = 5
+        # capture changes of the old db while rebuilding and replay them to the temporary db before publishing
+        self.captureChanges = False
+        self.captureKeys : dict[str, list[str] | None] | None = None
+        self.captureSeq = 0
+        # rows failing to restore are written to <db>_quarantine.sql instead of aborting the update
+        self.quarantineRows = False
+        self.dbQuarantineFileName = self.dbName + "_quarantine.sql"
+        self.quarantinedRows = 0
         self.allowedCharacters = 'a-zA-Z0-9+-_ÄäÖöÜüß'
 
+    # create updater using a sql creation script file, the script will be read not before update
+    @classmethod
+    def fromSqlFile(cls, dbPath : str, createDbSqlFile : str, **kwargs) -> 'SQLiteDbUpdater':
+        updater = cls(dbPath, None, **kwargs)
+        updater.createDbSqlFile = createDbSqlFile
+        return updater
+
+    def getCreateDbSql(self) -> str:
+        if self.createDbSql is not None:
+            return self.createDbSql
+        with open(self.createDbSqlFile, 'r', encoding='utf8') as f:
+            return f.read()
+
+    @property
+    def dbFilePath(self) -> str:
+        return os.path.join( self.workDir, self.dbFileName )
+
+    @property
+    def dbTmpFilePath(self) -> str:
+        return os.path.join( self.tmpDir or self.workDir, self.dbTmpFileName )
+
+    def getDumpFilePath(self, fileName : str) -> str:
+        return os.path.join( self.dumpDir or self.workDir, fileName )
+
     def log(self, msg : str, level : int = logging.INFO):
         if self.logger:
             self.logger.log( level, msg )
 
-    def enableLogging(self):
-        self.logger = logging.getLogger("SQLiteDbUpdater")
-        logging.basicConfig(filename=self.logFile, filemode='wt', level=logging.DEBUG,
-                            format='%(asctime)s %(levelname)s %(message)s', datefmt='%H:%M:%S')
+    # log to a logger of its own for this db, the process global logging configuration is not touched
+    # the records are queued and written by a listener thread to the log file and the given handlers
+    # they are not propagated to handlers of parent loggers, which would write them in the calling thread
+    def enableLogging(self, *handlers : logging.Handler):
+        self.disableLogging()
+        loggerName = 'SQLiteDbUpdater.' + re.sub( r'\W', '_', self.dbFilePath )
+        self.logger = logging.getLogger(loggerName)
+        self.logger.setLevel(logging.DEBUG)
+        self.logFileHandler = logging.FileHandler(self.logFile, mode='wt', encoding='utf8')
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S')
+        self.logFileHandler.setFormatter(formatter)
+        for handler in handlers:
+            if handler.formatter is None:
+                handler.setFormatter(formatter)
+        logQueue : queue.SimpleQueue = queue.SimpleQueue()
+        self.logListener = logging.handlers.QueueListener(logQueue, self.logFileHandler, *handlers,
+                                                          respect_handler_level=True)
+        self.logListener.start()
+        self.logHandler = logging.handlers.QueueHandler(logQueue)
+        self.logger.addHandler(self.logHandler)
+        self.logPropagate = self.logger.propagate
+        self.logger.propagate = False
         return self.logger
+
+    # stops the listener after all queued records are written
+    def disableLogging(self):
+        if self.logHandler:
+            if self.logger:
+                self.logger.removeHandler(self.logHandler)
+                self.logger.propagate = self.logPropagate
+            self.logHandler.close()
+            self.logHandler = None
+        if self.logListener:
+            self.logListener.stop()
+            self.logListener = None
+        if self.logFileHandler:
+            self.logFileHandler.close()
+            self.logFileHandler = None
     
     @staticmethod
-    def getTableInfo(cursor, tableName : str ):
-        colInfoByIdx : dict[int,ColInfo] = {}
-        cursor.execute( f'select * from "{tableName}"' )
-        rows = cursor.fetchall()
-        containsData = len(rows) > 0
-        cursor.execute( f'PRAGMA table_info("{tableName}");')
-        info = cursor.fetchall()
-        for idx,col in enumerate(info):
-            colInfo = ColInfo(col[0], col[1], col[2], col[3], col[4], col[5])
-            colInfoByIdx[idx] = colInfo
-        return TableInfo(tableName, colInfoByIdx, containsData)
-            
-    # create database info to decide later howto dump/restore data
+    def getTableInfo(cursor, tableName : str, schema : str = 'main' ):
+        cursor.execute( f'select 1 from "{schema}"."{tableName}" limit 1' )
+        containsData = cursor.fetchone() is not None
+        cursor.execute( f'PRAGMA "{schema}".table_info("{tableName}");')
+        colInfos = [ColInfo(*col[:6]) for col in cursor.fetchall()]
+        cursor.execute( f'PRAGMA "{schema}".foreign_key_list("{tableName}");')
+        fkCols : dict[int,list] = {}
+        for fkId, seq, referencedTable, colName, referencedColName, onUpdate, onDelete, match in cursor.fetchall():
+            fkCols.setdefault(fkId, [referencedTable, [], [], onUpdate, onDelete])
+            fkCols[fkId][1].append(colName)
+            fkCols[fkId][2].append(referencedColName)
+        foreignKeys = [ ForeignKeyInfo(fkId, referencedTable, tuple(colNames), tuple(referencedColNames), onUpdate,
+                                       onDelete)
+                        for fkId, (referencedTable, colNames, referencedColNames, onUpdate, onDelete)
+                        in sorted(fkCols.items()) ]
+        return TableInfo(tableName, colInfos, containsData, foreignKeys)
+
     @staticmethod
-    def getDbTableInfo(dbFileName : str ) -> dict[str,TableInfo]:
+    def getDbTableInfoFromConnection(conn, schema : str = 'main' ) -> dict[str,TableInfo]:
         dbTableInfo = {}
-        conn = sqlite3.connect(dbFileName)
+        cur = conn.cursor()
         try:
-            cur = conn.cursor()
-            cur.execute( 'select name from sqlite_master where type="table"' )
+            cur.execute( f'select name from "{schema}".sqlite_master where type="table"' )
             tableNames = cur.fetchall()
             for (tableName,) in tableNames:
-                dbTableInfo[tableName] = SQLiteDbUpdater.getTableInfo(cur, tableName)
+                dbTableInfo[tableName] = SQLiteDbUpdater.getTableInfo(cur, tableName, schema)
         finally:
-            conn.close()
-       
+            cur.close()
         return dbTableInfo
+
+    # create database info to decide later howto dump/restore data
+    @staticmethod
+    def getDbTableInfo(dbFileName : str, tracer : SqlTracer | None = None ) -> dict[str,TableInfo]:
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
+        try:
+            return SQLiteDbUpdater.getDbTableInfoFromConnection(conn)
+        finally:
+            conn.close()
+
+    # all connections of the updater are opened here, so they are traced by the tracer of the updater
+    @staticmethod
+    def connect(dbFileName : str, readOnly : bool = False, tracer : SqlTracer | None = None,
+                **kwargs) -> sqlite3.Connection:
+        if readOnly:
+            dbFileName = 'file:' + urllib.request.pathname2url(os.path.abspath(dbFileName)) + '?mode=ro'
+            kwargs['uri'] = True
+        if tracer is None or tracer.closed:
+            return sqlite3.connect(dbFileName, **kwargs)
+        conn = sqlite3.connect(dbFileName, factory=TracedConnection, **kwargs)
+        tracer.attach(conn)
+        return conn
+
+    # open an existing database without creating or changing it
+    @staticmethod
+    def connectReadOnly(dbFileName : str, tracer : SqlTracer | None = None ):
+        return SQLiteDbUpdater.connect(dbFileName, readOnly=True, tracer=tracer)
+
+    # physical settings of a db which are not part of the sql creation script
+    # a wal file is checkpointed into the db before reading it
+    @staticmethod
+    def getDbPhysicalSettings(dbFileName : str, tracer : SqlTracer | None = None ) -> dict[str,int|str]:
+        settings : dict[str,int|str] = {}
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
+        try:
+            for name in ('journal_mode', 'page_size', 'auto_vacuum', 'encoding', 'user_version', 'application_id'):
+                settings[name] = conn.execute( f'PRAGMA {name}' ).fetchone()[0]
+            if str(settings['journal_mode']).lower() == 'wal':
+                conn.execute( 'PRAGMA wal_checkpoint(TRUNCATE)' )
+        finally:
+            conn.close()
+        return settings
+
+    # apply physical settings to a new db, has to be done before any table is created,
+    # the journal mode is applied by applyDbJournalMode after restoring
+    @staticmethod
+    def applyDbPhysicalSettings(dbFileName : str, settings : dict[str,int|str], tracer : SqlTracer | None = None):
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
+        try:
+            conn.execute( f'PRAGMA page_size = {int(settings["page_size"])}' )
+            conn.execute( f'PRAGMA auto_vacuum = {int(settings["auto_vacuum"])}' )
+            conn.execute( f"PRAGMA encoding = '{settings['encoding']}'" )
+            # writing the header creates the db with the settings above
+            conn.execute( f'PRAGMA application_id = {int(settings["application_id"])}' )
+            conn.execute( f'PRAGMA user_version = {int(settings["user_version"])}' )
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def applyDbJournalMode(dbFileName : str, settings : dict[str,int|str], tracer : SqlTracer | None = None):
+        journalMode = str(settings['journal_mode']).upper()
+        if journalMode in ('DELETE', 'MEMORY', 'OFF'):
+            return
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
+        try:
+            conn.execute( f'PRAGMA journal_mode = {journalMode}' )
+        finally:
+            conn.close()
+
+    # normalized index definitions by index name
+    @staticmethod
+    def getDbIndexDefinitions(conn : sqlite3.Connection) -> dict[str, tuple[str, str|None]]:
+        rows = conn.execute( "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index'" ).fetchall()
+        return { name: ( tableName, ' '.join(sql.split()) if sql else None ) for name, tableName, sql in rows }
+
+    # planner statistics rows of a db, empty if the db never was analyzed
+    @staticmethod
+    def getDbStatRows(conn : sqlite3.Connection) -> dict[str, list[tuple]]:
+        return { statTable: conn.execute( f'SELECT * FROM {statTable}' ).fetchall()
+                 for statTable in SQLiteDbUpdater.getDbStatTableNames(conn) }
+
+    # planner statistics tables of a db, created by the first ANALYZE
+    @staticmethod
+    def getDbStatTableNames(conn : sqlite3.Connection) -> set[str]:
+        return { row[0] for row in conn.execute( "SELECT name FROM sqlite_master WHERE type = 'table' AND "\
+                                                 "name IN ('sqlite_stat1', 'sqlite_stat4')" ) }
+
+    # copy planner statistics of unchanged tables and indexes from the old db,
+    # run a bounded ANALYZE for the others, returns the analyzed tables
+    def updateStatistics(self, dbFileName : str, dbTmpFileName : str, restorePlan : RestorePlan | None) -> list[str]:
+        keptTables, oldIndexes, oldStatRows = set(), {}, {}
+        if restorePlan is not None:
+            keptTables = { oldTableName for oldTableName, tablePlan in restorePlan.tables.items()
+                           if oldTableName == tablePlan.newTableName and not tablePlan.columnsChanged }
+            conn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=self.sqlTracer)
+            try:
+                oldIndexes = SQLiteDbUpdater.getDbIndexDefinitions(conn)
+                oldStatRows = SQLiteDbUpdater.getDbStatRows(conn)
+            finally:
+                conn.close()
+
+        conn = SQLiteDbUpdater.connect(dbTmpFileName, tracer=self.sqlTracer)
+        try:
+            newTables = [ row[0] for row in conn.execute( "SELECT name FROM sqlite_master WHERE type = 'table' AND "\
+                                                          "substr(name, 1, 7) != 'sqlite_'" ) ]
+            newIndexes = SQLiteDbUpdater.getDbIndexDefinitions(conn)
+            keptTables &= set(newTables)
+            keptIndexes = { name for name, definition in newIndexes.items()
+                            if definition[0] in keptTables and oldIndexes.get(name) == definition }
+            # a table is analyzed again if one of its indexes has changed or it has no statistics
+            statTables = { row[0] for row in oldStatRows.get('sqlite_stat1', []) }
+            keptTables = { tableName for tableName in keptTables if tableName in statTables and
+                           all( name in keptIndexes for name, definition in newIndexes.items()
+                                if definition[0] == tableName ) }
+
+            # creates empty statistics tables
+            conn.execute( 'ANALYZE sqlite_schema' )
+            conn.execute( 'DELETE FROM sqlite_stat1' )
+            statTableNames = SQLiteDbUpdater.getDbStatTableNames(conn)
+            for statTable, rows in oldStatRows.items():
+                if statTable not in statTableNames:
+                    continue
+                rows = [ row for row in rows if row[0] in keptTables ]
+                if len(rows):
+                    conn.executemany( f'INSERT INTO {statTable} VALUES ({",".join("?" * len(rows[0]))})', rows )
+            conn.commit()
+
+            analyzeTables = [ tableName for tableName in newTables if tableName not in keptTables ]
+            conn.execute( f'PRAGMA analysis_limit = {int(self.analysisLimit)}' )
+            for tableName in analyzeTables:
+                conn.execute( f'ANALYZE "{tableName}"' )
+            conn.commit()
+        finally:
+            conn.close()
+        return analyzeTables
+
+    # get number of rows and bytes used per table, the dbstat table is used if available
+    @staticmethod
+    def getDbTableSizes(dbFileName : str, tracer : SqlTracer | None = None ) -> dict[str,tuple[int,int]]:
+        dbTableSizes : dict[str,tuple[int,int]] = {}
+        conn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=tracer)
+        try:
+            cur = conn.cursor()
+            cur.execute( 'select name from sqlite_master where type="table"' )
+            tableNames = [tableName for (tableName,) in cur.fetchall()]
+            try:
+                cur.execute( "select name, sum(case when pagetype = 'leaf' then ncell else 0 end), sum(pgsize) "\
+                             "from dbstat group by name" )
+                pagesByName = { name: (rows, size) for name, rows, size in cur.fetchall() }
+            except sqlite3.OperationalError:
+                pagesByName = None
+
+            if pagesByName is not None:
+                for tableName in tableNames:
+                    dbTableSizes[tableName] = pagesByName.get(tableName, (0, 0))
+            else:
+                # no dbstat available, estimate bytes by share of rows
+                pageCount = cur.execute( 'PRAGMA page_count' ).fetchone()[0]
+                pageSize = cur.execute( 'PRAGMA page_size' ).fetchone()[0]
+                rowsByName = {}
+                for tableName in tableNames:
+                    rowsByName[tableName] = cur.execute( f'select count(*) from "{tableName}"' ).fetchone()[0]
+                allRows = max(sum(rowsByName.values()), 1)
+                for tableName, rows in rowsByName.items():
+                    dbTableSizes[tableName] = (rows, pageCount * pageSize * rows // allRows)
+        finally:
+            conn.close()
+
+        return dbTableSizes
     
     # get fk names
     @staticmethod
-    def getDbForeignIndexNames(dbFileName):
+    def getDbForeignIndexNames(dbFileName, tracer : SqlTracer | None = None):
         dbForeignIndexNames = []
-        conn = sqlite3.connect(dbFileName)
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
         try:
             cur = conn.cursor()
             cur.execute( "select name from sqlite_master where type='index'" )
@@ -135,9 +685,9 @@ class SQLiteDbUpdater:
         return dbForeignIndexNames
 
     @staticmethod
-    def getDbViewNames(dbFileName):
+    def getDbViewNames(dbFileName, tracer : SqlTracer | None = None):
         dbViewNames = []
-        conn = sqlite3.connect(dbFileName)
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
         try:
             cur = conn.cursor()
             cur.execute( "select name from sqlite_master where type='view'" )
@@ -150,8 +700,8 @@ class SQLiteDbUpdater:
         return dbViewNames
 
     @staticmethod
-    def containsViews(dbFileName):
-        conn = sqlite3.connect(dbFileName)
+    def containsViews(dbFileName, tracer : SqlTracer | None = None):
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
         viewNames = []
         try:
             cur = conn.cursor()
@@ -162,9 +712,9 @@ class SQLiteDbUpdater:
         return len(viewNames) > 0
 
     @staticmethod
-    def getDbTriggerNames(dbFileName):
+    def getDbTriggerNames(dbFileName, tracer : SqlTracer | None = None):
         dbTriggerNames = []
-        conn = sqlite3.connect(dbFileName)
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=tracer)
         try:
             cur = conn.cursor()
             cur.execute( "select name from sqlite_master where type='trigger'" )
@@ -184,92 +734,357 @@ class SQLiteDbUpdater:
                 return True
         return False
 
-    def restoreTableByRow( self, tableRows, newTableName, file):
-        sql = f'INSERT INTO "{newTableName}" VALUES\n'
+    # sql literal of a value, control characters of strings are written by char(), so every row is one line
+    @staticmethod
+    def sqlValue(value) -> str:
+        if value is None:
+            return 'NULL'
+        if isinstance(value, ZeroBlob):
+            return f'zeroblob({int(value)})'
+        if isinstance(value, str):
+            return re.sub( r'[\x00-\x1f]', lambda m: f"'||char({ord(m.group())})||'",
+                           f"'{SQLiteDbUpdater.cleanSqlValue(value)}'" )
+        if isinstance(value, bytes):
+            return f"X'{value.hex()}'"
+        if isinstance(value, float):
+            if value != value:
+                return 'NULL'
+            if value in (float('inf'), float('-inf')):
+                return '9e999' if value > 0 else '-9e999'
+            return repr(value)
+        return str(value)
+
+    # value of a sql literal written by quote(), e.g. the captured keys, blobs are not valid json values
+    @staticmethod
+    def sqlLiteralValue(literal : str):
+        if literal == 'NULL':
+            return None
+        if literal.startswith("X'"):
+            return bytes.fromhex(literal[2:-1])
+        if literal.startswith("'"):
+            return literal[1:-1].replace("''", "'")
+        if re.fullmatch( r'-?\d+', literal ):
+            return int(literal)
+        return float(literal)
+
+    # write one INSERT statement, the values of the rows are ordered like colNames or like the table columns,
+    # with transformations the values are selected from a common table expression named by colNames
+    def writeInsert(self, file, newTableName, colNames : list[str] | None, tableRows,
+                    transformations : dict[str, str] | None = None):
+        quotedColNames = [ f'"{colName}"' for colName in colNames or [] ]
+        if transformations:
+            sql = f'WITH "restored"({",".join(quotedColNames)}) AS (VALUES\n'
+        elif colNames:
+            sql = f'INSERT INTO "{newTableName}"({",".join(quotedColNames)}) VALUES\n'
+        else:
+            sql = f'INSERT INTO "{newTableName}" VALUES\n'
         file.write(sql.encode('utf8'))
 
         sqlLines = []
         for row in tableRows:
-            cleanedRow = []
-            for val in row:
-                if isinstance(val, str):
-                    cleanedRow.append( f"'{SQLiteDbUpdater.cleanSqlValue(val)}'" )
-                else:
-                    cleanedRow.append( str(val) )
-            sqlLine = f"({", ".join(cleanedRow)})"
-            sqlLine = re.sub( "None", "NULL", sqlLine)
-            sqlLines.append(sqlLine)
-
+            sqlLines.append( f'({",".join( SQLiteDbUpdater.sqlValue(val) for val in row )})' )
         file.write(',\n'.join(sqlLines).encode('utf8'))
-        file.write(";\n".encode('utf8'))
 
-    def restoreTableByRowCol(self, tableRows, oldTableInfo : TableInfo, colNamesToRestore, newTableName, file):
-        oldColIdxByName = {} 
-        for colName in colNamesToRestore:
-            oldColIdxByName[colName] = oldTableInfo.colInfoByName[colName].cid
+        if transformations:
+            expressions = [ transformations.get(colName, quotedColName)
+                            for colName, quotedColName in zip(colNames, quotedColNames) ]
+            sql = f')\nINSERT INTO "{newTableName}"({",".join(quotedColNames)}) '\
+                  f'SELECT {",".join(expressions)} FROM "restored";\n'
+            file.write(sql.encode('utf8'))
+        else:
+            file.write(";\n".encode('utf8'))
 
-        quotedColNamesToRestore = []
-        for colName in colNamesToRestore:
-            quotedColNamesToRestore.append(f'"{colName}"')
+    def restoreTableByRow( self, tableRows, newTableName, file):
+        self.writeInsert( file, newTableName, None, tableRows )
 
-        sql = f'INSERT INTO "{newTableName}"({",".join(quotedColNamesToRestore)}) VALUES\n'
-        file.write(sql.encode('utf8'))
+    def restoreTableByRowCol(self, tableRows, oldTableInfo : TableInfo, colNamesToRestore, newTableName, file,
+                             newColNames : list[str] | None = None, transformations : dict[str, str] | None = None):
+        # because of reordering the values are picked by the column index of the old table
+        oldColIdxs = [ oldTableInfo.colInfoByName[colName].cid for colName in colNamesToRestore ]
+        rows = [ [ row[idx] for idx in oldColIdxs ] for row in tableRows ]
+        self.writeInsert( file, newTableName, newColNames or colNamesToRestore, rows, transformations )
 
-        sqlLines = []
-        for row in tableRows:
-            values = []
-            for colName in colNamesToRestore:
-                idx = oldColIdxByName[colName]
-                # because of reordering we have treat different by type (strings and the other types)
-                # in restoreTableByRow the list to string converter does this implicitely
-                if isinstance(row[idx], str):
-                    values.append( f"'{SQLiteDbUpdater.cleanSqlValue(row[idx])}'" )
-                else:
-                    values.append( str(row[idx]) )
-            
-            sqlLine = f'({",".join(values)})'
-            sqlLine = re.sub( "None", "NULL", sqlLine)
-            sqlLines.append(sqlLine)
+    # true if table rows are adressable by rowid, not given for WITHOUT ROWID tables or a column named rowid
+    @staticmethod
+    def hasRowid(conn : sqlite3.Connection, tableName : str) -> bool:
+        if 'rowid' in [ row[1].lower() for row in conn.execute( f'PRAGMA table_info("{tableName}")' ) ]:
+            return False
+        try:
+            conn.execute( f'SELECT rowid FROM "{tableName}" LIMIT 0' )
+        except sqlite3.OperationalError:
+            return False
+        return True
 
-        file.write(',\n'.join(sqlLines).encode('utf8'))
-        file.write(";\n".encode('utf8'))
+    # the INTEGER PRIMARY KEY column of a rowid table, which is an alias of the rowid
+    @staticmethod
+    def getRowidAlias(conn : sqlite3.Connection, tableName : str) -> str | None:
+        keyRows = [ row for row in conn.execute( f'PRAGMA table_info("{tableName}")' ) if row[5] ]
+        if len(keyRows) != 1 or keyRows[0][2].upper() != 'INTEGER' or \
+           not SQLiteDbUpdater.hasRowid(conn, tableName):
+            return None
+        return keyRows[0][1]
+
+    # names of the indexed columns of a table, None for indexes on expressions
+    @staticmethod
+    def getIndexedColNames(conn : sqlite3.Connection, tableName : str) -> set[str | None]:
+        colNames = set()
+        for indexRow in conn.execute( f'PRAGMA index_list("{tableName}")' ).fetchall():
+            colNames.update( row[2] for row in conn.execute( f'PRAGMA index_info("{indexRow[1]}")' ) )
+        return colNames
+
+    # CHECK constraints and triggers of the new table would see the zeroblob placeholders instead of the blobs
+    @staticmethod
+    def seesBlobPlaceholders(conn : sqlite3.Connection, tableName : str) -> bool:
+        (tableSql,) = conn.execute( 'SELECT sql FROM sqlite_master WHERE type = \'table\' AND name = ?',
+                                    (tableName,) ).fetchone()
+        return bool( re.search( r'\bCHECK\s*\(', tableSql, re.IGNORECASE ) or
+                     conn.execute( 'SELECT 1 FROM sqlite_master WHERE type = \'trigger\' AND tbl_name = ?',
+                                   (tableName,) ).fetchone() )
+
+    # columns containing blobs larger than blobStreamThreshold are restored by zeroblob placeholders and
+    # copied afterwards by incremental blob I/O, both tables have to be rowid tables, the new table must not
+    # check the blobs by constraints or triggers and incremental blob I/O can't write indexed columns
+    # the rows are found by the old rowid, so a rowid alias of the new table has to restore the old rowid
+    def evaluateBlobStreaming(self, restorePlan : RestorePlan, dbFileName : str, dbTmpFileName : str):
+        oldConn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=self.sqlTracer)
+        newConn = SQLiteDbUpdater.connectReadOnly(dbTmpFileName, tracer=self.sqlTracer)
+        try:
+            for oldTableName, tablePlan in restorePlan.tables.items():
+                colInfoByName = tablePlan.oldTableInfo.colInfoByName
+                candidates = [ oldName for oldName, newName in tablePlan.columnMapping.items()
+                               if newName not in tablePlan.transformations and
+                                  ( 'BLOB' in colInfoByName[oldName].type.upper() or
+                                    not colInfoByName[oldName].type.strip() ) ]
+                if not len(candidates) or not SQLiteDbUpdater.hasRowid(oldConn, oldTableName) or \
+                   not SQLiteDbUpdater.hasRowid(newConn, tablePlan.newTableName):
+                    continue
+                newRowidAlias = SQLiteDbUpdater.getRowidAlias(newConn, tablePlan.newTableName)
+                oldNameByNewName = { newName: oldName for oldName, newName in tablePlan.columnMapping.items() }
+                if newRowidAlias in oldNameByNewName and \
+                   ( newRowidAlias in tablePlan.transformations or
+                     oldNameByNewName[newRowidAlias] != SQLiteDbUpdater.getRowidAlias(oldConn, oldTableName) ):
+                    continue
+                indexedColNames = SQLiteDbUpdater.getIndexedColNames(newConn, tablePlan.newTableName)
+                if None in indexedColNames or \
+                   SQLiteDbUpdater.seesBlobPlaceholders(newConn, tablePlan.newTableName):
+                    continue
+                candidates = [ oldName for oldName in candidates
+                               if tablePlan.columnMapping[oldName] not in indexedColNames ]
+                for colName in candidates:
+                    if oldConn.execute( f'SELECT 1 FROM "{oldTableName}" WHERE typeof("{colName}") = \'blob\' AND '\
+                                        f'length("{colName}") > ? LIMIT 1', (self.blobStreamThreshold,) ).fetchone():
+                        tablePlan.streamedColumns.append(colName)
+                if len(tablePlan.streamedColumns):
+                    self.log( f'Large blobs of column(s) "{",".join(tablePlan.streamedColumns)}" of table '\
+                              f'"{oldTableName}" will be copied incrementally' )
+        finally:
+            oldConn.close()
+            newConn.close()
+
+    # rows are ordered by the primary key columns of the new table by their old names, if all of them are restored
+    # untransformed, else by the rowid of the old table
+    def evaluateKeyOrder(self, restorePlan : RestorePlan, newDbTableInfo : dict[str, TableInfo], dbFileName : str):
+        conn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=self.sqlTracer)
+        try:
+            for oldTableName, tablePlan in restorePlan.tables.items():
+                keyColInfos = sorted( [ colInfo for colInfo in newDbTableInfo[tablePlan.newTableName].colInfos
+                                        if colInfo.isPrimaryKey ], key=lambda colInfo: colInfo.isPrimaryKey )
+                oldNameByNewName = { newName: oldName for oldName, newName in tablePlan.columnMapping.items() }
+                if len(keyColInfos) and all( colInfo.name in oldNameByNewName and
+                                             colInfo.name not in tablePlan.transformations
+                                             for colInfo in keyColInfos ):
+                    tablePlan.orderBy = [ oldNameByNewName[colInfo.name] for colInfo in keyColInfos ]
+                elif SQLiteDbUpdater.hasRowid(conn, oldTableName):
+                    tablePlan.orderBy = [ 'rowid' ]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def getOrderByClause(tablePlan : TableRestorePlan) -> str:
+        if not len(tablePlan.orderBy):
+            return ''
+        return ' ORDER BY ' + ','.join( colName if colName == 'rowid' else f'"{colName}"'
+                                        for colName in tablePlan.orderBy )
 
-    # dump data of already existing database
-    def dumpData(self, dbFileName, dbDumpFileName, dumpStrategy):
-        conn = sqlite3.connect(dbFileName)
+    # dump data of already existing database in batches of dumpBatchSize rows
+    def dumpData(self, dbFileName, dbDumpFileName, restorePlan : RestorePlan):
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=self.sqlTracer)
         try:
             cur = conn.cursor()
             with open(dbDumpFileName, 'wb') as f:
                 cur.execute( 'select name from sqlite_master where type="table"' )
                 tableNames = cur.fetchall()
                 for (tableName,) in tableNames:
-                    strategy = dumpStrategy.get(tableName)
-                    if strategy:
-                        cur.execute( f'select * from {tableName}' )
-                        rows = cur.fetchall()
-                        if len(rows):
-                            strategy( self, rows, f )
+                    tablePlan = restorePlan.tables.get(tableName)
+                    if tablePlan and tablePlan.streamedColumns:
+                        self.dumpTableWithStreamedBlobs( cur, tablePlan, f )
+                    elif tablePlan:
+                        cur.execute( f'select * from "{tableName}"{SQLiteDbUpdater.getOrderByClause(tablePlan)}' )
+                        while len(rows := cur.fetchmany(self.dumpBatchSize)):
+                            if tablePlan.transformations:
+                                self.restoreTableByRowCol( rows, tablePlan.oldTableInfo, list(tablePlan.columnMapping),
+                                                           tablePlan.newTableName, f,
+                                                           list(tablePlan.columnMapping.values()),
+                                                           tablePlan.transformations )
+                            elif tablePlan.strategy == 'RowByNamedColumns':
+                                self.restoreTableByRowCol( rows, tablePlan.oldTableInfo, list(tablePlan.columnMapping),
+                                                           tablePlan.newTableName, f )
+                            else:
+                                self.restoreTableByRow( rows, tablePlan.newTableName, f )
         finally:                    
             conn.close()
 
-    # restore dumped data to temporary created database
+    # dump rows with rowid, large blobs are replaced by zeroblob placeholders of the same size
+    def dumpTableWithStreamedBlobs(self, cur : sqlite3.Cursor, tablePlan : TableRestorePlan, file):
+        colNames = list(tablePlan.columnMapping)
+        selectCols = [ 'rowid' ]
+        for colName in colNames:
+            if colName in tablePlan.streamedColumns:
+                selectCols.append( f'CASE WHEN typeof("{colName}") = \'blob\' AND length("{colName}") > '\
+                                   f'{int(self.blobStreamThreshold)} THEN zeroblob(0) ELSE "{colName}" END' )
+                selectCols.append( f'CASE WHEN typeof("{colName}") = \'blob\' AND length("{colName}") > '\
+                                   f'{int(self.blobStreamThreshold)} THEN length("{colName}") END' )
+            else:
+                selectCols.append( f'"{colName}"' )
+        newColNames = [ 'rowid' ] + [ tablePlan.columnMapping[colName] for colName in colNames ]
+
+        cur.execute( f'SELECT {",".join(selectCols)} FROM "{tablePlan.oldTableName}"'\
+                     f'{SQLiteDbUpdater.getOrderByClause(tablePlan)}' )
+        while len(rows := cur.fetchmany(self.dumpBatchSize)):
+            tableRows = []
+            for row in rows:
+                values, idx = [ row[0] ], 1
+                for colName in colNames:
+                    if colName in tablePlan.streamedColumns:
+                        values.append( row[idx] if row[idx + 1] is None else ZeroBlob(row[idx + 1]) )
+                        idx += 2
+                    else:
+                        values.append( row[idx] )
+                        idx += 1
+                tableRows.append(values)
+            self.writeInsert( file, tablePlan.newTableName, newColNames, tableRows, tablePlan.transformations )
+
+    # copy the blobs replaced by zeroblob placeholders in chunks, so they are never completely in memory
+    # rows missing in the new table were quarantined, their blobs are added to quarantineFile as UPDATE statements,
+    # without quarantineFile a missing row is an error
+    def restoreBlobs(self, dbFileName, dbTmpFileName, restorePlan : RestorePlan, quarantineFile : str | None = None):
+        srcConn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=self.sqlTracer)
+        dstConn = SQLiteDbUpdater.connect(dbTmpFileName, isolation_level=None, tracer=self.sqlTracer)
+        quarantine = open(quarantineFile, 'at', encoding='utf8') if quarantineFile else None
+        try:
+            dstConn.execute('BEGIN')
+            for oldTableName, tablePlan in restorePlan.tables.items():
+                for colName in tablePlan.streamedColumns:
+                    newColName = tablePlan.columnMapping[colName]
+                    rowids = srcConn.execute( f'SELECT rowid FROM "{oldTableName}" WHERE typeof("{colName}") = '\
+                                              f'\'blob\' AND length("{colName}") > ?',
+                                              (self.blobStreamThreshold,) ).fetchall()
+                    for (rowid,) in rowids:
+                        if not dstConn.execute( f'SELECT 1 FROM "{tablePlan.newTableName}" WHERE rowid = ?',
+                                                (rowid,) ).fetchone():
+                            if quarantine is None:
+                                raise ExportSQLiteError( 'Error', f'Row {rowid} of table "{tablePlan.newTableName}" '\
+                                                                  f'is missing, blob of column "{newColName}" '\
+                                                                  f'can\'t be copied' )
+                            quarantine.write( f'-- {oldTableName}: blob of quarantined row\n'\
+                                              f'UPDATE "{tablePlan.newTableName}" SET "{newColName}" = X\'' )
+                            with srcConn.blobopen(oldTableName, colName, rowid, readonly=True) as src:
+                                while len(chunk := src.read(self.blobChunkSize)):
+                                    quarantine.write(chunk.hex())
+                            quarantine.write( f'\' WHERE rowid = {rowid};\n' )
+                            continue
+                        with srcConn.blobopen(oldTableName, colName, rowid, readonly=True) as src, \
+                             dstConn.blobopen(tablePlan.newTableName, newColName, rowid) as dst:
+                            while len(chunk := src.read(self.blobChunkSize)):
+                                dst.write(chunk)
+            dstConn.execute('COMMIT')
+        finally:
+            if quarantine:
+                quarantine.close()
+            srcConn.close()
+            dstConn.close()
+
+    # split a dumped INSERT statement into table name, head, row lines and tail, every row is one line of the dump
+    # the table name is taken from the INSERT line, never from the rows
     @staticmethod
-    def restoreData( dbFileName, dbDumpFileName ):
-        with open(dbDumpFileName, 'rb') as f:
-            sql = f.read().decode('utf8')
-            conn = sqlite3.connect(dbFileName)
-            cur = conn.cursor()
+    def splitInsertStatement(sql : str) -> tuple[str, str, list[str], str]:
+        lines = sql.rstrip('\n').split('\n')
+        if lines[0].startswith('WITH '):
+            tailIdx = next( idx for idx, line in enumerate(lines) if idx and line.startswith('INSERT INTO ') )
+            rows = [ line.rstrip(',') for line in lines[1:tailIdx] ]
+            rows[-1] = rows[-1][:-1]
+            tableName = re.match( r'INSERT INTO "([^"]+)"', lines[tailIdx] ).group(1)
+            return tableName, lines[0], rows, ')\n' + '\n'.join(lines[tailIdx:])
+        rows = [ line.rstrip(',') for line in lines[1:] ]
+        rows[-1] = rows[-1][:-1]
+        return re.match( r'INSERT INTO "([^"]+)"', lines[0] ).group(1), lines[0], rows, ';'
+
+    # restore dumped data to temporary created database statement by statement in one transaction,
+    # each table and each statement runs under a savepoint, a failing statement is bisected to its failing rows,
+    # which are written with the error to quarantineFile, without quarantineFile the first failing row is reported
+    # functions are registered for transformations, returns the number of quarantined rows
+    @staticmethod
+    def restoreData( dbFileName, dbDumpFileName, functions : dict[str, Callable] | None = None,
+                     quarantineFile : str | None = None, tracer : SqlTracer | None = None ) -> int:
+        conn = SQLiteDbUpdater.connect(dbFileName, isolation_level=None, tracer=tracer)
+        for name, function in (functions or {}).items():
+            conn.create_function(name, -1, function, deterministic=True)
+        cur = conn.cursor()
+        quarantine = open(quarantineFile, 'wt', encoding='utf8') if quarantineFile else None
+        quarantinedRows = 0
+
+        def executeRows(tableName : str, head : str, rows : list[str], tail : str):
+            nonlocal quarantinedRows
+            cur.execute('SAVEPOINT "rows"')
             try:
-                cur.executescript(sql)
-                conn.commit()
-            finally:
-                cur.close()
-                conn.close()
+                cur.execute( head + '\n' + ',\n'.join(rows) + tail )
+                cur.execute('RELEASE "rows"')
+                return
+            except sqlite3.Error as e:
+                cur.execute('ROLLBACK TO "rows"')
+                cur.execute('RELEASE "rows"')
+                if len(rows) == 1:
+                    if quarantine is None:
+                        raise ExportSQLiteError( 'Error', f'Restoring of table "{tableName}" failed: {str(e)}, '\
+                                                          f'row: {rows[0][:200]}' )
+                    quarantine.write( f'-- {tableName}: {str(e)}\n{head}\n{rows[0]}{tail}\n' )
+                    quarantinedRows += 1
+                    return
+            executeRows( tableName, head, rows[:len(rows) // 2], tail )
+            executeRows( tableName, head, rows[len(rows) // 2:], tail )
+
+        try:
+            # foreign keys are checked afterwards, see checkForeignKeys
+            cur.execute('PRAGMA foreign_keys = OFF')
+            cur.execute('BEGIN')
+            currentTableName = None
+            with open(dbDumpFileName, 'r', encoding='utf8', newline='\n') as f:
+                lines = []
+                for line in f:
+                    lines.append(line)
+                    if line.endswith(';\n') and sqlite3.complete_statement(sql := ''.join(lines)):
+                        lines = []
+                        tableName, head, rows, tail = SQLiteDbUpdater.splitInsertStatement(sql)
+                        if tableName != currentTableName:
+                            if currentTableName is not None:
+                                cur.execute('RELEASE "table"')
+                            cur.execute('SAVEPOINT "table"')
+                            currentTableName = tableName
+                        executeRows( tableName, head, rows, tail )
+            if currentTableName is not None:
+                cur.execute('RELEASE "table"')
+            cur.execute('COMMIT')
+        finally:
+            if quarantine:
+                quarantine.close()
+            cur.close()
+            conn.close()
+        return quarantinedRows
 
     # dump views of already existing database
     def dumpViews(self, dbFileName, dbDumpFileName, renamingTableNames : dict[str,str],
                   renamingTableCols : dict[str,dict[str,str]]):
-        conn = sqlite3.connect(dbFileName)
+        conn = SQLiteDbUpdater.connect(dbFileName, tracer=self.sqlTracer)
         try:
             cur = conn.cursor()
             with open(dbDumpFileName, 'wb') as file:
@@ -281,28 +1096,26 @@ class SQLiteDbUpdater:
                         raise ExportSQLiteError( 'Error', f'View "{viewName}" contains not allowed character '\
                                                   f'"{wrongChar}"! Allowed are: "{self.allowedCharacters}"' )
 
-                    # treatment of renamed tables
+                    # treatment of renamed tables, names may be quoted
                     if len(renamingTableNames):
                         for oldTableName,newTableName in renamingTableNames.items():
-                            pattern = r'FROM +%s +' % oldTableName
-                            repl = r'FROM %s ' % newTableName
-                            viewSql = re.sub( pattern, repl, viewSql, 0, re.IGNORECASE )
-
-                            pattern = r'JOIN +%s +' % oldTableName
-                            repl = r'JOIN %s ' % newTableName
-                            viewSql = re.sub( pattern, repl, viewSql, 0, re.IGNORECASE )
+                            name = re.escape(oldTableName)
+                            pattern = rf'(\b(?:FROM|JOIN)\s+["`\[]?){name}(?=["`\]]?(?!\w))'
+                            viewSql = re.sub( pattern, lambda m: m.group(1) + newTableName, viewSql, 0,
+                                              re.IGNORECASE )
 
-                            pattern = r'([ \(")])%s\.' % oldTableName
-                            repl = r'\1%s.' % newTableName
-                            viewSql = re.sub( pattern, repl, viewSql, 0, re.IGNORECASE )
+                            pattern = rf'((?<![\w"`\]])["`\[]?){name}(?=["`\]]?\.)'
+                            viewSql = re.sub( pattern, lambda m: m.group(1) + newTableName, viewSql, 0,
+                                              re.IGNORECASE )
 
                     # treatment of renamed table cols
                     if len(renamingTableCols):
                         for tableName,colRenaming in renamingTableCols.items():
                             for oldColName,newColName in colRenaming.items():
-                                pattern = r' +%s\.%s +' % (tableName, oldColName)
-                                repl = r' %s.%s ' % (tableName, newColName)
-                                viewSql = re.sub( pattern, repl, viewSql, 0, re.IGNORECASE )
+                                pattern = rf'((?<![\w"`\]])["`\[]?{re.escape(tableName)}["`\]]?\.["`\[]?)'\
+                                          rf'{re.escape(oldColName)}(?=["`\]]?(?!\w))'
+                                viewSql = re.sub( pattern, lambda m: m.group(1) + newColName, viewSql, 0,
+                                                  re.IGNORECASE )
                     
                     # treatment of viewnames with ' '
                     if ' ' in viewName:
@@ -318,7 +1131,7 @@ class SQLiteDbUpdater:
     def restoreViews( self, dbFileName, dbDumpFileName ):
         with open(dbDumpFileName, 'rb') as file:
             sql = file.read().decode('utf8')
-            conn = sqlite3.connect(dbFileName)
+            conn = SQLiteDbUpdater.connect(dbFileName, tracer=self.sqlTracer)
             cur = conn.cursor()
             try:
                 cur.executescript(sql)
@@ -330,7 +1143,7 @@ class SQLiteDbUpdater:
                 conn.close()
 
     # replace the db-filename with the temp-db-filename
-    def substituteDbNameInSql(self, sql):
+    def substituteDbNameInSql(self, sql, dbTmpFileName : str | None = None):
         pattern = r"ATTACH \"([^\"]+)\""
         schemata = re.findall(pattern, sql)
         if len(schemata) > 1:
@@ -342,7 +1155,9 @@ class SQLiteDbUpdater:
         if match is None:
             raise ExportSQLiteError( 'Error', 'Cant find ATTACH pattern in SQL!' )
         prevDbName = match.group(2)
-        sql = re.sub(pattern, f'ATTACH "{self.dbTmpFileName}" AS "{self.dbName}"', sql)
+        if dbTmpFileName is None:
+            dbTmpFileName = self.dbTmpFileName
+        sql = re.sub(pattern, f'ATTACH "{dbTmpFileName}" AS "{self.dbName}"', sql)
         sql = re.sub( "\"" +  prevDbName + "\"\\.", "\"" + self.dbName + "\".", sql)
         return sql
 
@@ -408,7 +1223,7 @@ class SQLiteDbUpdater:
     
     # stores sql creation script for inspection purposes, create backup of an already existing one
     @staticmethod
-    def storeSql(sql, sqlFileName):
+    def storeSql(sql, sqlFileName, sqlSourceFileName : str | None = None):
         sqlTmpFileName = sqlFileName + "~"
 
         if os.path.isfile(sqlTmpFileName):
@@ -417,6 +1232,10 @@ class SQLiteDbUpdater:
         if os.path.isfile(sqlFileName):
             os.rename( sqlFileName, sqlTmpFileName )
 
+        if sqlSourceFileName:
+            shutil.copyfile( sqlSourceFileName, sqlFileName )
+            return
+
         with open(sqlFileName, 'w') as f:
             f.write(sql)
 
@@ -435,20 +1254,21 @@ class SQLiteDbUpdater:
         return cleanedRow
     
     def findTableByFingerprint(self, tableInfo : TableInfo, newDbTableInfo : dict[str,TableInfo]) -> (str|None):
-        colNames = list(tableInfo.colInfoByName.keys())
+        fingerprint = tableInfo.fingerprint
         for newTableName, newTableInfo in newDbTableInfo.items():
-            newColNames = list(newTableInfo.colInfoByName.keys())
-            if newColNames == colNames:
+            if newTableInfo.fingerprint == fingerprint:
                 return newTableName
         return None
     
-    def evaluateRestoreStrategy(self, oldDbTableInfo : dict[str, TableInfo], newDbTableInfo : dict[str, TableInfo]):
-        restoreStrategy = {}
-        renamingTableNames : dict[str,str] = {}
-        renamingTableCols : dict[str,dict[str,str]] = {}
+    # evaluate how to restore the data of each table, see README "Some comments to data preserving"
+    def evaluateRestoreStrategy(self, oldDbTableInfo : dict[str, TableInfo],
+                                newDbTableInfo : dict[str, TableInfo]) -> RestorePlan:
+        restorePlan = RestorePlan(self.dbPath)
+        renamingTableNames = restorePlan.renamingTableNames
+        renamingTableCols = restorePlan.renamingTableCols
         newTables = newDbTableInfo.keys()
         oldTables = oldDbTableInfo.keys()
-        droppedTables : list[str] = []
+        droppedTables = restorePlan.droppedTables
         for oldTableName, oldTableInfo in oldDbTableInfo.items():
             newTableInfo = newDbTableInfo.get(oldTableName)
             if newTableInfo is None:
@@ -465,14 +1285,14 @@ class SQLiteDbUpdater:
                 newTableName = oldTableName
 
             assert newTableInfo
+            transformations = self.columnTransformations.get(newTableName, {})
 
-            strategy = ""
+            tablePlan = None
             # Case 1: no columndef changed
             diffList = newTableInfo.diff(oldTableInfo)
             if not len(diffList):
-                restoreStrategy[oldTableName] = lambda self, tableRows, file, nameOfNewTable=newTableName : \
-                    SQLiteDbUpdater.restoreTableByRow( self, tableRows, nameOfNewTable, file )
-                strategy = "RowByRow(No columns changed)"
+                tablePlan = TableRestorePlan( oldTableName, newTableName, 'RowByRow', 'No columns changed',
+                                              { name: name for name in oldTableInfo.fingerprint } )
             else:
                 self.log( f'Table "{newTableName}" fingerprint has been changed ({",".join(diffList)}), '\
                            'maybe data will be not restored correctly!', logging.WARN )
@@ -484,7 +1304,7 @@ class SQLiteDbUpdater:
                 removedCols = []
                 colNamesToRestore = []
                 for name,colInfo in oldTableInfo.colInfoByName.items():
-                    if not name in newTableInfo.colInfoByName.keys():
+                    if not name in newTableInfo.colInfoByName:
                         removedCols.append( name )
                     else:
                         colNamesToRestore.append(name)
@@ -495,7 +1315,7 @@ class SQLiteDbUpdater:
                             changedToNotNullCols.append(name)
 
                 for name,colInfo in newTableInfo.colInfoByName.items():
-                    if not name in oldTableInfo.colInfoByName.keys():
+                    if not name in oldTableInfo.colInfoByName:
                         addedCols.append( name )
                         if colInfo.notNull:
                             addedNotNullCols.append(name)
@@ -506,19 +1326,18 @@ class SQLiteDbUpdater:
                                'start without "notNull" in the first run, fill in data and then change definition to '\
                                '"notNull" in the second run!', logging.WARN )
 
-                if len(changedTypeCols):
-                    self.log( f'Type of column(s) "{",".join( changedTypeCols )}" has been changed, if restoring of '\
+                untransformedCols = [ name for name in changedTypeCols if name not in transformations ]
+                if len(untransformedCols):
+                    self.log( f'Type of column(s) "{",".join( untransformedCols )}" has been changed, if restoring of '\
                                'data leads to problems, adapt data before change the datatype!', logging.WARN )
                     
                 # Case 2:
                 # only col footprint changed, only added, only removed or only moved cols
                 if (len(addedCols) * len(removedCols)) == 0:
-                    restoreStrategy[oldTableName] = lambda self, tableRows, file, \
-                        tableInfo=copy.deepcopy(oldTableInfo), colNames=colNamesToRestore, \
-                        nameOfNewTable=newTableName : \
-                        SQLiteDbUpdater.restoreTableByRowCol(
-                            self, tableRows, tableInfo, colNames, nameOfNewTable, file )
-                    strategy = "RowByNamedColumns(Columns added, columns removed or columns moved)"
+                    tablePlan = TableRestorePlan( oldTableName, newTableName, 'RowByNamedColumns',
+                                                  'Columns added, columns removed or columns moved',
+                                                  { name: name for name in colNamesToRestore },
+                                                  columnsChanged=True, changedTypeColumns=changedTypeCols )
                 # Case 3:
                 # check for renamed cols
                 elif len(addedCols) == len(removedCols):
@@ -538,16 +1357,18 @@ class SQLiteDbUpdater:
                                    logging.ERROR )
                         raise ExportSQLiteError( 'Error', f'Restoring is not possible for table: {oldTableName}!')
 
-                    restoreStrategy[oldTableName] = lambda self, tableRows, file, nameOfNewTable=newTableName : \
-                        SQLiteDbUpdater.restoreTableByRow( self, tableRows, nameOfNewTable, file )
-                    strategy = "RowByRow(Columns renamed)"
-
                     # record renamings, for renaming in views
                     renamingCols : dict[str,str] = {}
                     for oldToNew in list(map(lambda x,y:(x,y), removedCols, addedCols)):
                         renamingCols[oldToNew[0]] = oldToNew[1]
                     renamingTableCols[newTableName] = renamingCols
 
+                    tablePlan = TableRestorePlan( oldTableName, newTableName, 'RowByRow', 'Columns renamed',
+                                                  { name: renamingCols.get(name, name)
+                                                    for name in oldTableInfo.fingerprint },
+                                                  renamedColumns=renamingCols, columnsChanged=True,
+                                                  changedTypeColumns=changedTypeCols )
+
                 # Case 4: added and removed are not equal and both > 0 -> Error
                 else:
                     self.log( f'Column(s) "{",".join( addedCols )}" has been added, this matches not the number of '\
@@ -556,7 +1377,15 @@ class SQLiteDbUpdater:
                                logging.ERROR )
                     raise ExportSQLiteError( 'Error', f'Restoring is not possible for table: {oldTableName}!')
 
-            self.log( f'Dump/Restore table "{oldTableName}" by strategy: {strategy}')
+            tablePlan.oldTableInfo = oldTableInfo
+            for colName, expression in transformations.items():
+                if colName in tablePlan.columnMapping.values():
+                    tablePlan.transformations[colName] = expression
+                else:
+                    self.log( f'Transformation of column "{newTableName}.{colName}" ignored, column is not restored!',
+                              logging.WARN )
+            restorePlan.tables[oldTableName] = tablePlan
+            self.log( f'Dump/Restore table "{oldTableName}" by strategy: {tablePlan.label}')
 
         if len(droppedTables) > 0 and len(newTables) == len(oldTables):
             err = f'Possibly renamed tables "{droppedTables}" could not be assigned to new names, also not by '\
@@ -565,35 +1394,477 @@ class SQLiteDbUpdater:
             self.log( err, logging.ERROR )
             raise ExportSQLiteError( 'Error', f'Restoring is not possible for tables: {droppedTables}!')
 
-        return restoreStrategy,renamingTableNames,renamingTableCols
+        restoredTableNames = { tablePlan.newTableName for tablePlan in restorePlan.tables.values() }
+        restorePlan.createdTables = [ name for name in newDbTableInfo if name not in restoredTableNames ]
+        return restorePlan
+
+    # row count and checksum of tables, computed in parallel on own read connections
+    # the checksum is the sum of the crc32 of the quoted values of each row, quote() keeps the storage class
+    # tableColumns: table name -> column names to build the checksum of
+    def getTableChecksums(self, dbFileName : str,
+                          tableColumns : dict[str,list[str]]) -> dict[str,tuple[int,int]]:
+        def getTableChecksum(tableName : str, colNames : list[str]) -> tuple[int,int]:
+            conn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=self.sqlTracer)
+            try:
+                conn.create_function('crc32', 1, zlib.crc32, deterministic=True)
+                row = "||','||".join( f'quote("{colName}")' for colName in colNames )
+                checksum = f'sum(crc32(CAST({row} AS BLOB)))' if colNames else '0'
+                count, checksum = conn.execute( f'select count(*), {checksum} from "{tableName}"' ).fetchone()
+                return count, checksum or 0
+            finally:
+                conn.close()
 
-    # udpdate/create database in a most secure way
-    # all updates changes will be made in a temporary created db
-    # if all stuff went well, replace the current db with the temporary created one
-    def update(self):
-        self.log('Update started')
-        os.chdir( self.workDir )
+        with ThreadPoolExecutor(max_workers=max(1, self.verifyWorkers)) as executor:
+            futures = { tableName: executor.submit(getTableChecksum, tableName, colNames)
+                        for tableName, colNames in tableColumns.items() }
+            return { tableName: future.result() for tableName, future in futures.items() }
+
+    # compare restored data of the temporary db with the data of the old db
+    # rows inserted by the creation script (seedChecksums) are not taken into account
+    # columns with changed type are only counted, their values may have been converted
+    def verifyRestoredData(self, dbFileName : str, dbTmpFileName : str, restorePlan : RestorePlan,
+                           seedChecksums : dict[str,tuple[int,int]]):
+        oldTableColumns, newTableColumns = self.getVerifyColumns(restorePlan)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            oldFuture = executor.submit(self.getTableChecksums, dbFileName, oldTableColumns)
+            newFuture = executor.submit(self.getTableChecksums, dbTmpFileName, newTableColumns)
+            oldChecksums, newChecksums = oldFuture.result(), newFuture.result()
+
+        failedTables = []
+        for oldTableName, tablePlan in restorePlan.tables.items():
+            oldCount, oldChecksum = oldChecksums[oldTableName]
+            newCount, newChecksum = newChecksums[tablePlan.newTableName]
+            seedCount, seedChecksum = seedChecksums.get(tablePlan.newTableName, (0, 0))
+            newCount -= seedCount
+            newChecksum -= seedChecksum
+            if oldCount != newCount or oldChecksum != newChecksum:
+                self.log( f'Verification of table "{tablePlan.newTableName}" failed, {oldCount} rows expected, '\
+                          f'{newCount} rows restored{"" if oldCount != newCount else ", checksums differ"}!',
+                          logging.ERROR )
+                failedTables.append(tablePlan.newTableName)
+
+        if len(failedTables):
+            raise ExportSQLiteError( 'Error', f'Verification of restored data failed for tables: {failedTables}!')
 
-        self.log(f'Store original db definition sql file "{self.dbOrigDefinitionFileName}"' )
-        SQLiteDbUpdater.storeSql( self.createDbSql, self.dbOrigDefinitionFileName)
+    @staticmethod
+    def getVerifyColumns(restorePlan : RestorePlan) -> tuple[dict[str,list[str]],dict[str,list[str]]]:
+        oldTableColumns : dict[str,list[str]] = {}
+        newTableColumns : dict[str,list[str]] = {}
+        for oldTableName, tablePlan in restorePlan.tables.items():
+            mapping = [ (oldName, newName) for oldName, newName in tablePlan.columnMapping.items()
+                        if oldName not in tablePlan.changedTypeColumns and
+                           newName not in tablePlan.transformations ]
+            oldTableColumns[oldTableName] = [ oldName for oldName, _ in mapping ]
+            newTableColumns[tablePlan.newTableName] = [ newName for _, newName in mapping ]
+        return oldTableColumns, newTableColumns
+
+    # tables, which may violate foreign keys after restoring: tables with changed foreign key definitions,
+    # tables with changed columns or names and tables referencing them
+    @staticmethod
+    def getForeignKeyCheckTables(restorePlan : RestorePlan, oldDbTableInfo : dict[str, TableInfo],
+                                 newDbTableInfo : dict[str, TableInfo]) -> list[str]:
+        changedTables = set(restorePlan.createdTables)
+        restoredTables = set()
+        fkChangedTables = set()
+        for oldTableName, tablePlan in restorePlan.tables.items():
+            restoredTables.add(tablePlan.newTableName)
+            if tablePlan.columnsChanged or oldTableName != tablePlan.newTableName:
+                changedTables.add(tablePlan.newTableName)
+
+            # compare foreign keys of old table mapped to new names
+            oldForeignKeys = set()
+            for fk in oldDbTableInfo[oldTableName].foreignKeys:
+                referencedPlan = restorePlan.tables.get(fk.referencedTable)
+                referencedMapping = referencedPlan.columnMapping if referencedPlan else {}
+                oldForeignKeys.add(( restorePlan.renamingTableNames.get(fk.referencedTable, fk.referencedTable),
+                                     tuple(tablePlan.columnMapping.get(name, name) for name in fk.colNames),
+                                     tuple(referencedMapping.get(name, name) for name in fk.referencedColNames) ))
+            newForeignKeys = { (fk.referencedTable, fk.colNames, fk.referencedColNames)
+                               for fk in newDbTableInfo[tablePlan.newTableName].foreignKeys }
+            if oldForeignKeys != newForeignKeys:
+                fkChangedTables.add(tablePlan.newTableName)
+
+        checkTables = []
+        for tableName in restoredTables:
+            referencedTables = { fk.referencedTable for fk in newDbTableInfo[tableName].foreignKeys }
+            if len(referencedTables) and ( tableName in fkChangedTables or tableName in changedTables or
+                                           not referencedTables.isdisjoint(changedTables) ):
+                checkTables.append(tableName)
+        return sorted(checkTables)
+
+    # run foreign key check for the given tables, report violations grouped by constraint with sample rowids,
+    # WITHOUT ROWID tables have no rowids to sample
+    def checkForeignKeyViolations(self, dbFileName : str, tableNames : list[str],
+                                  newDbTableInfo : dict[str, TableInfo], sampleSize : int = 5) -> list[dict]:
+        violations : list[dict] = []
+        conn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=self.sqlTracer)
+        try:
+            for tableName in tableNames:
+                foreignKeys = { fk.id: fk for fk in newDbTableInfo[tableName].foreignKeys }
+                violationsByFk : dict[int,dict] = {}
+                for _, rowid, referencedTable, fkId in conn.execute( f'PRAGMA foreign_key_check("{tableName}")' ):
+                    violation = violationsByFk.get(fkId)
+                    if violation is None:
+                        fk = foreignKeys.get(fkId)
+                        violation = { 'table': tableName, 'referencedTable': referencedTable,
+                                      'columns': list(fk.colNames) if fk else [],
+                                      'referencedColumns': list(fk.referencedColNames) if fk else [],
+                                      'count': 0, 'sampleRowids': [] }
+                        violationsByFk[fkId] = violation
+                    violation['count'] += 1
+                    if rowid is not None and len(violation['sampleRowids']) < sampleSize:
+                        violation['sampleRowids'].append(rowid)
+                violations.extend(violationsByFk.values())
+        finally:
+            conn.close()
+
+        for violation in violations:
+            self.log( f'Foreign key "{violation["table"]}"({",".join(violation["columns"])}) -> '\
+                      f'"{violation["referencedTable"]}"({",".join(violation["referencedColumns"])}) is violated by '\
+                      f'{violation["count"]} row(s)' +
+                      ( f', e.g. rowids {violation["sampleRowids"]}' if violation['sampleRowids'] else '' ),
+                      logging.WARN )
+        return violations
+
+    # throughput of the last dump/restore, measured by update
+    def getThroughput(self) -> float:
+        throughputFileName = os.path.join( self.workDir, self.dbThroughputFileName )
+        try:
+            with open(throughputFileName, 'r') as f:
+                return float(json.load(f)['throughput'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return self.defaultThroughput
+
+    def storeThroughput(self, bytesRestored : int, seconds : float):
+        # small dumps do not give meaningful numbers
+        if bytesRestored < 1024 * 1024 or seconds <= 0:
+            return
+        throughputFileName = os.path.join( self.workDir, self.dbThroughputFileName )
+        with open(throughputFileName, 'w') as f:
+            json.dump({ 'throughput': bytesRestored / seconds }, f)
+
+    # add row/byte/duration estimations of the old database to the plan
+    def estimateRestorePlan(self, restorePlan : RestorePlan, dbFileName : str):
+        restorePlan.throughput = self.getThroughput()
+        dbTableSizes = SQLiteDbUpdater.getDbTableSizes( dbFileName, self.sqlTracer )
+        for tableName, tablePlan in restorePlan.tables.items():
+            tablePlan.estimatedRows, tablePlan.estimatedBytes = dbTableSizes.get(tableName, (0, 0))
+            tablePlan.estimatedSeconds = tablePlan.estimatedBytes / restorePlan.throughput
+
+    # check for enough free disk space before any work, the need is estimated from the page count of the db
+    def checkFreeSpace(self):
+        dbSize = 0
+        if os.path.isfile(self.dbFilePath):
+            conn = SQLiteDbUpdater.connectReadOnly(self.dbFilePath, tracer=self.sqlTracer)
+            try:
+                pageCount = conn.execute( 'PRAGMA page_count' ).fetchone()[0]
+                pageSize = conn.execute( 'PRAGMA page_size' ).fetchone()[0]
+                dbSize = pageCount * pageSize
+            finally:
+                conn.close()
 
+        tmpDir = self.tmpDir or self.workDir
+        neededSpace : dict[int,tuple[str,int]] = {}
+        def addNeededSpace(dirName : str, size : int):
+            device = os.stat(dirName).st_dev
+            neededSize = neededSpace.get(device, (dirName, 0))[1]
+            neededSpace[device] = (dirName, neededSize + size)
+
+        addNeededSpace(tmpDir, dbSize)
+        addNeededSpace(self.dumpDir or self.workDir, int(dbSize * self.dumpSizeFactor))
+        if not SQLiteDbUpdater.isSameDevice(tmpDir, self.workDir):
+            # the temporary db has to be copied next to the db before replacing it
+            addNeededSpace(self.workDir, dbSize)
+
+        for dirName, neededSize in neededSpace.values():
+            freeSize = shutil.disk_usage(dirName).free
+            self.log(f'Free space check "{dirName}": {neededSize} bytes needed, {freeSize} bytes free')
+            if freeSize < neededSize:
+                raise ExportSQLiteError( 'Error', f'Not enough free space in "{dirName}", {neededSize} bytes needed '\
+                                                  f'but only {freeSize} bytes available!' )
+
+    @staticmethod
+    def isSameDevice(dirName : str, otherDirName : str) -> bool:
+        return os.stat(dirName).st_dev == os.stat(otherDirName).st_dev
+
+    # columns identifying captured rows of the old tables: the old names of the primary key columns of the new table,
+    # None if the key is not restored untransformed, then the whole table is copied again on changes
+    @staticmethod
+    def getCaptureKeys(restorePlan : RestorePlan, newDbTableInfo : dict[str, TableInfo]) -> dict[str, list[str] | None]:
+        captureKeys : dict[str, list[str] | None] = {}
+        for oldTableName, tablePlan in restorePlan.tables.items():
+            keyColInfos = sorted( [ colInfo for colInfo in newDbTableInfo[tablePlan.newTableName].colInfos
+                                    if colInfo.isPrimaryKey ], key=lambda colInfo: colInfo.isPrimaryKey )
+            oldNameByNewName = { newName: oldName for oldName, newName in tablePlan.columnMapping.items() }
+            captureKeys[oldTableName] = None
+            if len(keyColInfos) and all( colInfo.name in oldNameByNewName and
+                                         colInfo.name not in tablePlan.transformations for colInfo in keyColInfos ):
+                captureKeys[oldTableName] = [ oldNameByNewName[colInfo.name] for colInfo in keyColInfos ]
+        return captureKeys
+
+    # triggers of the old db write the keys of inserted, updated and deleted rows to the capture table
+    def installChangeCapture(self, dbFileName : str, captureKeys : dict[str, list[str] | None]):
+        conn = SQLiteDbUpdater.connect(dbFileName, isolation_level=None, tracer=self.sqlTracer)
+        try:
+            conn.execute( f'PRAGMA busy_timeout = {int(self.busyTimeout)}' )
+            conn.execute( 'BEGIN IMMEDIATE' )
+            conn.execute( f'CREATE TABLE "{self.captureTableName}"(seq INTEGER PRIMARY KEY, '\
+                          f'tableName TEXT NOT NULL, key TEXT)' )
+            for tableName, keyColNames in captureKeys.items():
+                tableNameLiteral = SQLiteDbUpdater.sqlValue(tableName)
+                def capture(row : str) -> str:
+                    key = f'json_array({",".join( f"quote({row}.\"{colName}\")" for colName in keyColNames )})' \
+                          if keyColNames else 'NULL'
+                    return f'INSERT INTO "{self.captureTableName}"(tableName, key) VALUES ({tableNameLiteral}, {key});'
+                for operation, captures in ( ('INSERT', capture('NEW')), ('DELETE', capture('OLD')),
+                                             ('UPDATE', capture('OLD') + ' ' + capture('NEW')) ):
+                    conn.execute( f'CREATE TRIGGER "{self.captureTableName}_{tableName}_{operation}" AFTER {operation} '\
+                                  f'ON "{tableName}" BEGIN {captures} END' )
+            conn.execute( 'COMMIT' )
+        except Exception:
+            if conn.in_transaction:
+                conn.execute( 'ROLLBACK' )
+            raise
+        finally:
+            conn.close()
+        self.captureKeys = captureKeys
+        self.captureSeq = 0
+
+    # remove capture table and triggers from the old db, e.g. after a failed update
+    def removeChangeCapture(self, dbFileName : str):
+        if self.captureKeys is None or not os.path.isfile(dbFileName):
+            return
+        conn = SQLiteDbUpdater.connect(dbFileName, isolation_level=None, tracer=self.sqlTracer)
+        try:
+            conn.execute( f'PRAGMA busy_timeout = {int(self.busyTimeout)}' )
+            conn.execute( 'BEGIN IMMEDIATE' )
+            for tableName in self.captureKeys:
+                for operation in ( 'INSERT', 'DELETE', 'UPDATE' ):
+                    conn.execute( f'DROP TRIGGER IF EXISTS "{self.captureTableName}_{tableName}_{operation}"' )
+            conn.execute( f'DROP TABLE IF EXISTS "{self.captureTableName}"' )
+            conn.execute( 'COMMIT' )
+        finally:
+            conn.close()
+        self.captureKeys = None
+
+    # copy the current state of the rows captured since captureSeq from the old db to the temporary db
+    # through the column mapping, rows are deleted and inserted again, tables without key are copied completely
+    def replayChanges(self, dbFileName : str, dbTmpFileName : str, restorePlan : RestorePlan) -> int:
+        srcConn = SQLiteDbUpdater.connect(dbFileName, isolation_level=None, tracer=self.sqlTracer)
+        dstConn = SQLiteDbUpdater.connect(dbTmpFileName, isolation_level=None, tracer=self.sqlTracer)
+        for name, function in self.sqlFunctions.items():
+            dstConn.create_function(name, -1, function, deterministic=True)
+        replayedRows = 0
+        try:
+            # one read transaction, so the captured keys match the read rows
+            srcConn.execute( 'BEGIN' )
+            captures = srcConn.execute( f'SELECT seq, tableName, key FROM "{self.captureTableName}" WHERE seq > ? '\
+                                        f'ORDER BY seq', (self.captureSeq,) ).fetchall()
+            if not len(captures):
+                return 0
+            changedKeys : dict[str, dict[str, None] | None] = {}
+            for seq, tableName, key in captures:
+                if self.captureKeys.get(tableName) is None:
+                    changedKeys[tableName] = None
+                else:
+                    changedKeys.setdefault(tableName, {})[key] = None
+
+            dstConn.execute( 'PRAGMA foreign_keys = OFF' )
+            dstConn.execute( 'BEGIN' )
+            for tableName, keys in changedKeys.items():
+                tablePlan = restorePlan.tables[tableName]
+                oldColNames = list(tablePlan.columnMapping)
+                newColNames = list(tablePlan.columnMapping.values())
+                quotedNewColNames = ",".join( f'"{colName}"' for colName in newColNames )
+                expressions = ",".join( tablePlan.transformations.get(colName, f'"{colName}"')
+                                        for colName in newColNames )
+                insertSql = f'INSERT INTO "{tablePlan.newTableName}"({quotedNewColNames}) SELECT {expressions} FROM '\
+                            f'(SELECT {",".join( f"? AS \"{colName}\"" for colName in newColNames )})'
+                selectSql = f'SELECT {",".join( f"\"{colName}\"" for colName in oldColNames )} FROM "{tableName}"'
+                if keys is None:
+                    dstConn.execute( f'DELETE FROM "{tablePlan.newTableName}"' )
+                    rows = srcConn.execute( selectSql ).fetchall()
+                else:
+                    keyColNames = self.captureKeys[tableName]
+                    condition = ' AND '.join( f'"{colName}" IS ?' for colName in keyColNames )
+                    newCondition = ' AND '.join( f'"{tablePlan.columnMapping[colName]}" IS ?' for colName in keyColNames )
+                    rows = []
+                    for key in keys:
+                        keyValues = [ SQLiteDbUpdater.sqlLiteralValue(literal) for literal in json.loads(key) ]
+                        dstConn.execute( f'DELETE FROM "{tablePlan.newTableName}" WHERE {newCondition}', keyValues )
+                        rows += srcConn.execute( f'{selectSql} WHERE {condition}', keyValues ).fetchall()
+                dstConn.executemany( insertSql, rows )
+                replayedRows += len(rows)
+            dstConn.execute( 'COMMIT' )
+            self.captureSeq = captures[-1][0]
+            self.log( f'Replayed {len(captures)} captured changes, {replayedRows} rows of tables '\
+                      f'{list(changedKeys)} copied again' )
+            return len(captures)
+        finally:
+            if srcConn.in_transaction:
+                srcConn.execute( 'ROLLBACK' )
+            srcConn.close()
+            dstConn.close()
+
+    # copy the temporary db into the db by the backup api, the write lock of the db is held only while copying
+    # connected readers see the new schema with their next transaction
+    def publishTmpDbByBackup(self):
+        srcConn = SQLiteDbUpdater.connect( self.dbTmpFilePath, tracer=self.sqlTracer )
+        dstConn = SQLiteDbUpdater.connect( self.dbFilePath, timeout=self.busyTimeout / 1000, tracer=self.sqlTracer )
+        try:
+            dstConn.execute( f'PRAGMA busy_timeout = {int(self.busyTimeout)}' )
+            for attempt in range(1, self.publishRetries + 1):
+                try:
+                    srcConn.backup( dstConn )
+                    break
+                except sqlite3.OperationalError as e:
+                    if attempt == self.publishRetries or not re.search( r'locked|busy', str(e), re.IGNORECASE ):
+                        raise ExportSQLiteError( 'Error', f'Publishing temporary db to "{self.dbFilePath}" failed: '\
+                                                          f'{str(e)}' )
+                    self.log( f'Db "{self.dbFilePath}" is busy, publishing retry {attempt} of '\
+                              f'{self.publishRetries - 1}', logging.WARN )
+                    time.sleep( attempt * self.busyTimeout / 1000 / self.publishRetries )
+        finally:
+            srcConn.close()
+            dstConn.close()
+        os.remove( self.dbTmpFilePath )
+
+    # replace the db by the temporary db, copy it first if it was created on another device
+    def moveTmpDbToDb(self):
+        dbTmpFilePath = self.dbTmpFilePath
+        if self.publishMode == 'backup' and os.path.isfile(self.dbFilePath):
+            return self.publishTmpDbByBackup()
+        if not SQLiteDbUpdater.isSameDevice(os.path.dirname(dbTmpFilePath), self.workDir):
+            copiedTmpFilePath = os.path.join( self.workDir, self.dbTmpFileName )
+            self.log(f'Copy temporary db file "{dbTmpFilePath}" to "{copiedTmpFilePath}"')
+            shutil.copyfile( dbTmpFilePath, copiedTmpFilePath )
+            os.remove( dbTmpFilePath )
+            dbTmpFilePath = copiedTmpFilePath
+        os.replace( dbTmpFilePath, self.dbFilePath )
+
+    # adapt the sql creation script of the workbench model for the temporary db
+    def adaptSql(self, sql : str, dbTmpFileName : str | None = None ) -> str:
         self.log('Substitute db name in sql')
-        sql = self.substituteDbNameInSql( self.createDbSql )
+        sql = self.substituteDbNameInSql( sql, dbTmpFileName )
 
         self.log('Fix index statements in sql')
         sql = self.fixIndexStatementsInSql( sql )
 
         self.log('Change DECIMAL to NUMERIC statements in sql')
         sql = self.changeDecimalToNumericInSql( sql )
+        return sql
 
-        self.log(f'Store db updated/adapted creation sql file "{self.dbDefinitionFileName}"' )
-        SQLiteDbUpdater.storeSql( sql, self.dbDefinitionFileName)
+    # dry run of update, evaluates the restore plan without creating/changing any file
+    def explain(self) -> RestorePlan:
+        sql = self.adaptSql( self.getCreateDbSql(), ':memory:' )
+        conn = SQLiteDbUpdater.connect(':memory:', tracer=self.sqlTracer)
+        try:
+            conn.executescript(sql)
+            newDbTableInfo = SQLiteDbUpdater.getDbTableInfoFromConnection( conn, self.dbName )
+        finally:
+            conn.close()
 
-        # create db in dbTmpFileName
-        self.log(f'Create db in temporary file "{self.dbTmpFileName}"' )
-        if os.path.isfile(self.dbTmpFileName):
-            os.remove( self.dbTmpFileName )
-        conn = sqlite3.connect(self.dbTmpFileName)
+        if not os.path.isfile(self.dbPath):
+            return RestorePlan(self.dbPath, createdTables=list(newDbTableInfo))
+
+        conn = SQLiteDbUpdater.connectReadOnly(self.dbPath, tracer=self.sqlTracer)
+        try:
+            oldDbTableInfo = SQLiteDbUpdater.getDbTableInfoFromConnection( conn )
+        finally:
+            conn.close()
+
+        restorePlan = self.evaluateRestoreStrategy(oldDbTableInfo, newDbTableInfo)
+        self.estimateRestorePlan(restorePlan, self.dbPath)
+        return restorePlan
+
+    # sql of tables, indexes, views and triggers by type and name, normalized by whitespace
+    @staticmethod
+    def getDbSchemaObjects(dbFileName : str, tracer : SqlTracer | None = None) -> dict[str, dict[str, str]]:
+        schemaObjects : dict[str, dict[str, str]] = { 'table': {}, 'index': {}, 'view': {}, 'trigger': {} }
+        conn = SQLiteDbUpdater.connectReadOnly(dbFileName, tracer=tracer)
+        try:
+            for objectType, name, sql in conn.execute( "SELECT type, name, sql FROM sqlite_master WHERE "\
+                                                       "sql IS NOT NULL AND substr(name, 1, 7) != 'sqlite_'" ):
+                schemaObjects[objectType][name] = ' '.join(sql.split())
+        finally:
+            conn.close()
+        return schemaObjects
+
+    # statements changing indexes, views and triggers of the old db to the new definitions, None if tables changed
+    # views of the old db which are not in the new db are kept, like they are restored by a rebuild
+    @staticmethod
+    def getInPlaceStatements(oldSchemaObjects : dict[str, dict[str, str]],
+                             newSchemaObjects : dict[str, dict[str, str]]) -> list[str] | None:
+        if oldSchemaObjects['table'] != newSchemaObjects['table']:
+            return None
+        statements = []
+        for objectType in ( 'trigger', 'view', 'index' ):
+            for name, sql in oldSchemaObjects[objectType].items():
+                newSql = newSchemaObjects[objectType].get(name)
+                if newSql != sql and ( newSql is not None or objectType != 'view' ):
+                    statements.append( f'DROP {objectType.upper()} "{name}"' )
+        for objectType in ( 'index', 'view', 'trigger' ):
+            for name, sql in newSchemaObjects[objectType].items():
+                if oldSchemaObjects[objectType].get(name) != sql:
+                    statements.append( sql )
+        return statements
+
+    # execute all statements in one transaction on the existing db
+    def updateInPlace(self, dbFileName : str, statements : list[str]):
+        conn = SQLiteDbUpdater.connect(dbFileName, isolation_level=None, tracer=self.sqlTracer)
+        try:
+            conn.execute( 'BEGIN IMMEDIATE' )
+            for sql in statements:
+                self.log( f'Execute in place: {sql}', logging.DEBUG )
+                conn.execute( sql )
+            if self.analyze:
+                conn.execute( f'PRAGMA analysis_limit = {int(self.analysisLimit)}' )
+                for sql in statements:
+                    match = re.match( r'CREATE (?:UNIQUE )?INDEX "?([^"\s(]+)', sql, re.IGNORECASE )
+                    if match:
+                        conn.execute( f'ANALYZE "{match.group(1)}"' )
+            conn.execute( 'COMMIT' )
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute( 'ROLLBACK' )
+            raise ExportSQLiteError( 'Error', f'Exception on in place update: {str(e)}' )
+        finally:
+            conn.close()
+
+    # run a phase of update, if profile is set the cProfile statistics are written to <db>_<phase>.pstats and the
+    # profileTopN largest allocations to <db>_<phase>_alloc.txt
+    def runPhase(self, phaseName : str, function : Callable, *args):
+        if not self.profile:
+            return function(*args)
+        startTracing = not tracemalloc.is_tracing()
+        if startTracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function, *args)
+        finally:
+            snapshot = tracemalloc.take_snapshot().filter_traces( [ tracemalloc.Filter(False, tracemalloc.__file__) ] )
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            if startTracing:
+                tracemalloc.stop()
+            profilePath = os.path.join( self.workDir, f'{self.dbName}_{phaseName}' )
+            profiler.dump_stats( profilePath + '.pstats' )
+            with open( profilePath + '_alloc.txt', 'wt', encoding='utf8' ) as f:
+                for stat in snapshot.statistics('lineno')[:self.profileTopN]:
+                    f.write( f'{stat}\n' )
+            self.phasePeakMemory[phaseName] = peakMemory
+            self.log( f'Phase "{phaseName}" peak traced memory: {peakMemory} bytes, profile: "{profilePath}.pstats"' )
+
+    # create db from the adapted creation sql, the physical settings have to be applied before
+    @staticmethod
+    def createDb(dbTmpFilePath : str, sql : str, dbPhysicalSettings : dict[str,int|str] | None,
+                 tracer : SqlTracer | None = None):
+        if os.path.isfile(dbTmpFilePath):
+            os.remove( dbTmpFilePath )
+        if dbPhysicalSettings:
+            SQLiteDbUpdater.applyDbPhysicalSettings( dbTmpFilePath, dbPhysicalSettings, tracer )
+        conn = SQLiteDbUpdater.connect(dbTmpFilePath, tracer=tracer)
         cur = None
         try:        
             cur = conn.cursor()
@@ -604,37 +1875,231 @@ class SQLiteDbUpdater:
                 cur.close()
             conn.close()
 
+    # udpdate/create database in a most secure way
+    # all updates changes will be made in a temporary created db
+    # if all stuff went well, replace the current db with the temporary created one
+    def update(self):
+        try:
+            if self.traceSql:
+                self.updateTraced()
+            else:
+                self.updateDb()
+        except Exception:
+            self.removeChangeCapture(self.dbFilePath)
+            raise
+
+    def updateTraced(self):
+        slowLogPath = os.path.join( self.workDir, self.dbSlowLogFileName )
+        self.sqlTracer = SqlTracer( slowLogPath, self.slowStatementSeconds )
+        try:
+            return self.updateDb()
+        finally:
+            self.sqlTracer.close()
+            self.log( f'Traced {self.sqlTracer.statementCount} sql statements taking {self.sqlTracer.seconds:.1f} '\
+                      f'seconds, {len(self.sqlTracer.slowStatements)} statements slower than '\
+                      f'{self.slowStatementSeconds} seconds logged to "{slowLogPath}"' )
+
+    def updateDb(self):
+        self.log('Update started')
+
+        self.log('Check free space')
+        self.checkFreeSpace()
+
+        dbFilePath = self.dbFilePath
+        dbTmpFilePath = self.dbTmpFilePath
+        dbOrigDefinitionFilePath = self.getDumpFilePath( self.dbOrigDefinitionFileName )
+        dbDefinitionFilePath = self.getDumpFilePath( self.dbDefinitionFileName )
+        dbRestoreDataFilePath = self.getDumpFilePath( self.dbRestoreDataFileName )
+        dbRestoreViewsFilePath = self.getDumpFilePath( self.dbRestoreViewsFileName )
+
+        dbPhysicalSettings = None
+        if os.path.isfile(dbFilePath):
+            self.log( 'Retrieve old db physical settings' )
+            dbPhysicalSettings = SQLiteDbUpdater.getDbPhysicalSettings( dbFilePath, self.sqlTracer )
+            self.log( f'Old db physical settings: {dbPhysicalSettings}' )
+
+        self.log(f'Store original db definition sql file "{dbOrigDefinitionFilePath}"' )
+        SQLiteDbUpdater.storeSql( self.createDbSql, dbOrigDefinitionFilePath, self.createDbSqlFile )
+
+        sql = self.adaptSql( self.getCreateDbSql(), dbTmpFilePath )
+
+        self.log(f'Store db updated/adapted creation sql file "{dbDefinitionFilePath}"' )
+        SQLiteDbUpdater.storeSql( sql, dbDefinitionFilePath)
+
+        # create db in dbTmpFilePath
+        self.log(f'Create db in temporary file "{dbTmpFilePath}"' )
+        self.runPhase( 'create', self.createDb, dbTmpFilePath, sql, dbPhysicalSettings, self.sqlTracer )
+
         self.log( 'Retrieve new table/index/view/trigger info' )
-        newDbTableInfo = SQLiteDbUpdater.getDbTableInfo( self.dbTmpFileName )
-        newDbForeignIndexNames = SQLiteDbUpdater.getDbForeignIndexNames( self.dbTmpFileName )
-        newDbViewNames = SQLiteDbUpdater.getDbViewNames( self.dbTmpFileName )
-        newDbTriggerNames = SQLiteDbUpdater.getDbTriggerNames( self.dbTmpFileName )
+        newDbTableInfo = SQLiteDbUpdater.getDbTableInfo( dbTmpFilePath, self.sqlTracer )
+        newDbForeignIndexNames = SQLiteDbUpdater.getDbForeignIndexNames( dbTmpFilePath, self.sqlTracer )
+        newDbViewNames = SQLiteDbUpdater.getDbViewNames( dbTmpFilePath, self.sqlTracer )
+        newDbTriggerNames = SQLiteDbUpdater.getDbTriggerNames( dbTmpFilePath, self.sqlTracer )
 
         self.log( 'Check new table/index/view/trigger names' )
         self.checkNames( newDbTableInfo, newDbForeignIndexNames, newDbViewNames, newDbTriggerNames )
 
+        if self.inPlace and os.path.isfile(dbFilePath):
+            statements = SQLiteDbUpdater.getInPlaceStatements( SQLiteDbUpdater.getDbSchemaObjects(dbFilePath, self.sqlTracer),
+                                                               SQLiteDbUpdater.getDbSchemaObjects(dbTmpFilePath, self.sqlTracer) )
+            if statements is not None:
+                self.log( f'Tables are unchanged, update indexes, views and triggers of "{dbFilePath}" in place by '\
+                          f'{len(statements)} statements' )
+                self.runPhase( 'inPlace', self.updateInPlace, dbFilePath, statements )
+                os.remove( dbTmpFilePath )
+                self.log('Update finished')
+                return
+
         # backup/restore data
-        if os.path.isfile(self.dbFileName):
+        restorePlan = None
+        if os.path.isfile(dbFilePath):
             self.log( 'Retrieve old table info' )
-            oldDbTableInfo = SQLiteDbUpdater.getDbTableInfo( self.dbFileName )
+            oldDbTableInfo = SQLiteDbUpdater.getDbTableInfo( dbFilePath, self.sqlTracer )
             self.log( 'Evaluate restore strategy for tables' )
-            restoreStrategy,renamingTableNames,renamingTableCols = \
-                self.evaluateRestoreStrategy(oldDbTableInfo, newDbTableInfo)
+            restorePlan = self.runPhase( 'plan', self.evaluateRestoreStrategy, oldDbTableInfo, newDbTableInfo )
+            if self.captureChanges:
+                self.log( f'Install change capture in "{dbFilePath}"' )
+                self.installChangeCapture( dbFilePath, SQLiteDbUpdater.getCaptureKeys(restorePlan, newDbTableInfo) )
             if SQLiteDbUpdater.containsData(oldDbTableInfo):
-                self.log(f'Backup and restore already existing db data for "{self.dbFileName}"')
-                self.log(f'Dump db data to "{self.dbRestoreDataFileName}"' )
-                self.dumpData(self.dbFileName, self.dbRestoreDataFileName, restoreStrategy)
-                self.log(f'Restore db data from: "{self.dbRestoreDataFileName}" to temporary db "{self.dbTmpFileName}"')
-                SQLiteDbUpdater.restoreData(self.dbTmpFileName, self.dbRestoreDataFileName)
-
-            if SQLiteDbUpdater.containsViews(self.dbFileName):
-                self.dumpViews(self.dbFileName, self.dbRestoreViewsFileName, renamingTableNames, renamingTableCols )
-                self.restoreViews(self.dbTmpFileName, self.dbRestoreViewsFileName)
-
-        # on success replace dbFileName by dbTmpFileName
-        self.log(f'Move data from temporary db file "{self.dbTmpFileName}" to "{self.dbFileName}"')
-        if os.path.isfile(self.dbFileName):
-            os.remove( self.dbFileName )
-        os.rename( self.dbTmpFileName, self.dbFileName  )
+                self.runPhase( 'estimate', self.estimateRestorePlan, restorePlan, dbFilePath )
+                self.evaluateBlobStreaming(restorePlan, dbFilePath, dbTmpFilePath)
+                if self.orderByKey:
+                    self.evaluateKeyOrder(restorePlan, newDbTableInfo, dbFilePath)
+                self.log(f'Restore plan: {restorePlan.toJson()}', logging.DEBUG)
+                self.log(f'Backup and restore already existing db data for "{dbFilePath}", estimated '\
+                         f'{restorePlan.estimatedRows} rows, {restorePlan.estimatedBytes} bytes, '\
+                         f'{restorePlan.estimatedSeconds:.1f} seconds')
+                if self.verifyData:
+                    seedChecksums = self.getTableChecksums( dbTmpFilePath, self.getVerifyColumns(restorePlan)[1] )
+                startTime = time.perf_counter()
+                self.log(f'Dump db data to "{dbRestoreDataFilePath}"' )
+                self.runPhase( 'dump', self.dumpData, dbFilePath, dbRestoreDataFilePath, restorePlan )
+                self.log(f'Restore db data from: "{dbRestoreDataFilePath}" to temporary db "{dbTmpFilePath}"')
+                dbQuarantineFilePath = self.getDumpFilePath( self.dbQuarantineFileName ) if self.quarantineRows else None
+                self.quarantinedRows = self.runPhase( 'restore', self.restoreData, dbTmpFilePath, dbRestoreDataFilePath,
+                                                      self.sqlFunctions, dbQuarantineFilePath, self.sqlTracer )
+                if self.quarantinedRows:
+                    self.log( f'{self.quarantinedRows} rows failed to restore, see "{dbQuarantineFilePath}"',
+                              logging.WARN )
+                if any( len(tablePlan.streamedColumns) for tablePlan in restorePlan.tables.values() ):
+                    self.log(f'Copy large blobs to temporary db "{dbTmpFilePath}"')
+                    self.runPhase( 'restoreBlobs', self.restoreBlobs, dbFilePath, dbTmpFilePath, restorePlan,
+                                   dbQuarantineFilePath )
+                seconds = time.perf_counter() - startTime
+                self.log(f'Dump/Restore of db data took {seconds:.1f} seconds')
+                self.storeThroughput(restorePlan.estimatedBytes, seconds)
+
+                if self.captureKeys is not None:
+                    self.log('Replay changes captured while dumping/restoring')
+                    self.runPhase( 'replay', self.replayChanges, dbFilePath, dbTmpFilePath, restorePlan )
+
+                if self.verifyData:
+                    startTime = time.perf_counter()
+                    self.log('Verify restored data')
+                    self.runPhase( 'verify', self.verifyRestoredData, dbFilePath, dbTmpFilePath, restorePlan,
+                                   seedChecksums )
+                    self.log(f'Verification of restored data took {time.perf_counter() - startTime:.1f} seconds')
+
+            if self.checkForeignKeys:
+                checkTables = SQLiteDbUpdater.getForeignKeyCheckTables(restorePlan, oldDbTableInfo, newDbTableInfo)
+                self.log(f'Check foreign keys of tables: {checkTables}')
+                self.foreignKeyViolations = self.runPhase( 'checkForeignKeys', self.checkForeignKeyViolations,
+                                                           dbTmpFilePath, checkTables, newDbTableInfo )
+
+            if SQLiteDbUpdater.containsViews(dbFilePath, self.sqlTracer):
+                self.runPhase( 'dumpViews', self.dumpViews, dbFilePath, dbRestoreViewsFilePath,
+                               restorePlan.renamingTableNames, restorePlan.renamingTableCols )
+                self.runPhase( 'restoreViews', self.restoreViews, dbTmpFilePath, dbRestoreViewsFilePath )
+
+        if self.analyze:
+            startTime = time.perf_counter()
+            self.log('Update planner statistics')
+            analyzedTables = self.runPhase( 'analyze', self.updateStatistics, dbFilePath, dbTmpFilePath, restorePlan )
+            self.log(f'Analyzed tables: {analyzedTables}, statistics of other tables kept')
+            self.log(f'Update of planner statistics took {time.perf_counter() - startTime:.1f} seconds')
+
+        if dbPhysicalSettings:
+            SQLiteDbUpdater.applyDbJournalMode( dbTmpFilePath, dbPhysicalSettings, self.sqlTracer )
+
+        # changes of the old db between this final catch-up and the publishing are lost
+        if self.captureKeys is not None:
+            self.log('Replay changes captured until now')
+            self.runPhase( 'finalReplay', self.replayChanges, dbFilePath, dbTmpFilePath, restorePlan )
+
+        # on success replace dbFilePath by dbTmpFilePath
+        self.log(f'Move data from temporary db file "{dbTmpFilePath}" to "{dbFilePath}"')
+        self.runPhase( 'move', self.moveTmpDbToDb )
 
         self.log('Update finished')
+
+# update one database, used by the process pool of main
+def updateDatabase(dbPath : str, createDbSqlFile : str, tmpDir : str | None,
+                   dumpDir : str | None, inPlace : bool = False,
+                   publishMode : str = 'replace') -> tuple[str,str,float,str]:
+    startTime = time.perf_counter()
+    status, message = 'OK', ''
+    updater = SQLiteDbUpdater.fromSqlFile(dbPath, createDbSqlFile)
+    updater.inPlace = inPlace
+    updater.publishMode = publishMode
+    # own scratch directories for each db, because db file names may be the same in different directories
+    scratchName = updater.dbName + '-' + hashlib.sha1(updater.dbFilePath.encode('utf8')).hexdigest()[:8]
+    for scratchDir, attrName in ((tmpDir, 'tmpDir'), (dumpDir, 'dumpDir')):
+        if scratchDir:
+            setattr(updater, attrName, os.path.join(scratchDir, scratchName))
+            os.makedirs(getattr(updater, attrName), exist_ok=True)
+    try:
+        updater.enableLogging()
+        updater.update()
+    except Exception as e:
+        status = 'ERROR'
+        message = e.args[1] if isinstance(e, ExportSQLiteError) and len(e.args) > 1 else f'{type(e).__name__}: {e}'
+        updater.log( f'Update failed: {message}', logging.ERROR )
+    finally:
+        updater.disableLogging()
+    return dbPath, status, time.perf_counter() - startTime, message
+
+# headless update of many databases by one creation script, e.g.
+# python SQLiteDbUpdater.py model.sql customers/*.sqlite
+def main(argv : list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Create/update SQLite databases by a sql creation script')
+    parser.add_argument('script', help='sql creation script, e.g. exported by the ManageSQLite wizard')
+    parser.add_argument('databases', nargs='+', help='database files or glob patterns')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of parallel updates')
+    parser.add_argument('--tmp-dir', help='directory for the temporary databases')
+    parser.add_argument('--dump-dir', help='directory for the dump files')
+    parser.add_argument('--in-place', action='store_true',
+                        help='update indexes, views and triggers in place, if no table has changed')
+    parser.add_argument('--publish', choices=['replace', 'backup'], default='replace',
+                        help='replace the db file or copy into the db by the backup api, which keeps it open')
+    args = parser.parse_args(argv)
+
+    createDbSqlFile = os.path.abspath(args.script)
+    if not os.path.isfile(createDbSqlFile):
+        print(f'Sql creation script "{args.script}" not found!', file=sys.stderr)
+        return 1
+
+    dbPaths : list[str] = []
+    for pattern in args.databases:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for dbPath in matches:
+            dbPath = os.path.abspath(dbPath)
+            if dbPath not in dbPaths:
+                dbPaths.append(dbPath)
+    if not len(dbPaths):
+        print('No databases found!', file=sys.stderr)
+        return 1
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs or 1, len(dbPaths)))) as executor:
+        results = list(executor.map(updateDatabase, dbPaths, [createDbSqlFile] * len(dbPaths),
+                                    [args.tmp_dir] * len(dbPaths), [args.dump_dir] * len(dbPaths),
+                                    [args.in_place] * len(dbPaths), [args.publish] * len(dbPaths)))
+
+    nameWidth = max(len('Database'), *(len(dbPath) for dbPath, _, _, _ in results))
+    print(f'{"Database":<{nameWidth}}  {"Status":<6}  {"Duration[s]":>11}  Message')
+    for dbPath, status, seconds, message in results:
+        print(f'{dbPath:<{nameWidth}}  {status:<6}  {seconds:>11.2f}  {message}')
+
+    return 0 if all(status == 'OK' for _, status, _, _ in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
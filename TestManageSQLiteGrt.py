@@ -0,0 +1,259 @@
+import sys, os, types, unittest, sqlite3
+from types import SimpleNamespace as NS
+from unittest import mock
+
+# Get the current script's directory
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+# The plugin runs inside MySQL Workbench only, its modules are replaced by
+# the few members used by exportSQLite
+class DefineModule:
+    def __init__(self, **kwargs):
+        self.version = kwargs.get('version')
+
+    def plugin(self, *args, **kwargs):
+        return lambda function: function
+
+    def export(self, *args, **kwargs):
+        return lambda function: function
+
+grtModule = types.ModuleType('grt')
+grtModule.INT = int
+grtModule.classes = NS(db_Catalog=object)
+grtModule.modules = NS(Workbench=NS(confirm=lambda *args: 0))
+grtModule.root = NS(wb=NS(info=NS(version=NS(majorNumber=8, minorNumber=0, releaseNumber=40)),
+                          doc=NS(info=NS(author='', caption='', project='', dateChanged='', dateCreated='',
+                                         description=''))))
+wbModule = types.ModuleType('wb')
+wbModule.DefineModule = DefineModule
+wbModule.wbinputs = NS(currentCatalog=lambda: None)
+workbenchModule = types.ModuleType('workbench')
+workbenchUiModule = types.ModuleType('workbench.ui')
+workbenchUiModule.WizardForm = object
+workbenchUiModule.WizardPage = object
+workbenchModule.ui = workbenchUiModule
+
+with mock.patch.dict(sys.modules, { 'grt': grtModule, 'mforms': mock.MagicMock(), 'wb': wbModule,
+                                    'workbench': workbenchModule, 'workbench.ui': workbenchUiModule }):
+    import manage_sqlite_grt
+
+class Table(NS):
+    def inserts(self):
+        return self.insertsSql
+
+class TestExportSQLite(unittest.TestCase):
+    def setUp(self):
+        manage_sqlite_grt.table_record_cache.clear()
+        manage_sqlite_grt.table_sql_cache.clear()
+        self.errors = []
+        self.patches = [ mock.patch.object(manage_sqlite_grt, 'ExportSQLiteWizard', self.wizard),
+                         mock.patch.object(manage_sqlite_grt.mforms.Utilities, 'show_error',
+                                           lambda title, message, *args: self.errors.append(message)) ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    # replaces the wizard, keeps the generated script
+    def wizard(self, sqlPath):
+        self.sqlPath = sqlPath
+        with open(sqlPath, 'r', encoding='utf-8') as f:
+            self.sql = f.read()
+        return NS(run=lambda: None)
+
+    def column(self, name, typeName='INT', isNotNull=0, autoIncrement=0, length=-1, explicitParams=''):
+        return NS(name=name, simpleType=NS(name=typeName), userType=None, flags=[], length=length,
+                  datatypeExplicitParams=explicitParams, isNotNull=isNotNull, autoIncrement=autoIncrement,
+                  defaultValue='', comment='')
+
+    def index(self, name, indexType, columns, isPrimary=0):
+        return NS(name=name, indexType=indexType, isPrimary=isPrimary,
+                  columns=[ NS(referencedColumn=column, descend=0) for column in columns ])
+
+    def table(self, name, columns, primaryKey=None, inserts='', comment=''):
+        indices = [ self.index('PRIMARY', 'PRIMARY', primaryKey, 1) ] if primaryKey else []
+        return Table(__id__='{%s}' % name, name=name, comment=comment, lastChangeDate='2024-01-01 10:00',
+                     columns=columns, indices=indices, foreignKeys=[], insertsSql=inserts)
+
+    def catalog(self, *tables):
+        return NS(schemata=[ NS(name='main', comment='', tables=list(tables)) ])
+
+    # generated statement of the table, starting with the command
+    def export(self, catalog, tableName, command='CREATE TABLE'):
+        self.sql = None
+        self.assertEqual( manage_sqlite_grt.exportSQLite(catalog), 0, self.errors )
+        start = self.sql.index('%s "%s"' % (command, tableName))
+        return self.sql[start:self.sql.index(';\n', start) + 2]
+
+    # Test unchanged tables are not read again and changed settings are applied
+    # @unittest.skip("skipped temporarily")
+    def test_TableCache(self):
+        idColumn = self.column('id', isNotNull=1)
+        tbl = self.table('course', [idColumn, self.column('name', 'VARCHAR', length=45)], [idColumn])
+        catalog = self.catalog(tbl)
+        self.assertEqual( self.export(catalog, 'course'), 'CREATE TABLE "course"(\n'\
+                                                          '  "id" INTEGER PRIMARY KEY NOT NULL,\n'\
+                                                          '  "name" VARCHAR(45)\n'\
+                                                          ');\n' )
+
+        # columns of an unchanged table are not read
+        columns = tbl.columns
+        tbl.columns = None
+        self.assertIn( '"name" VARCHAR(45)', self.export(catalog, 'course') )
+
+        with mock.patch.object(manage_sqlite_grt, 'strict_tables', True):
+            self.assertIn( '"name" TEXT', self.export(catalog, 'course') )
+
+        tbl.columns = columns
+        tbl.columns[1].length = 60
+        tbl.lastChangeDate = '2024-01-01 10:01'
+        self.assertIn( '"name" VARCHAR(60)', self.export(catalog, 'course') )
+
+        # a renamed referenced column changes the referencing table, but not its lastChangeDate
+        courseColumn = self.column('course_id')
+        participant = self.table('participant', [ self.column('id'), courseColumn ])
+        participant.foreignKeys = [ NS(name='fk_course', columns=[courseColumn], referencedTable=tbl,
+                                       referencedColumns=[idColumn], deleteRule='NO ACTION', updateRule='NO ACTION',
+                                       comment='') ]
+        catalog = self.catalog(tbl, participant)
+        self.assertIn( 'REFERENCES "course"("id")', self.export(catalog, 'participant') )
+        idColumn.name = 'id_course'
+        tbl.lastChangeDate = '2024-01-01 10:02'
+        self.assertIn( 'REFERENCES "course"("id_course")', self.export(catalog, 'participant') )
+
+    # Test the generated script file is removed after the wizard has been closed
+    # @unittest.skip("skipped temporarily")
+    def test_RemoveScriptFile(self):
+        self.export(self.catalog(self.table('course', [ self.column('id') ])), 'course')
+        self.assertFalse( os.path.exists(self.sqlPath) )
+
+        # and on errors
+        tbl = self.table('course', [ self.column('id') ], inserts='INSERT INTO `other` (`id`) VALUES (1);')
+        files = []
+        namedTemporaryFile = manage_sqlite_grt.tempfile.NamedTemporaryFile
+        def recordFile(*args, **kwargs):
+            files.append(namedTemporaryFile(*args, **kwargs))
+            return files[-1]
+        with mock.patch.object(manage_sqlite_grt.tempfile, 'NamedTemporaryFile', recordFile):
+            self.assertEqual( manage_sqlite_grt.exportSQLite(self.catalog(tbl)), 1 )
+        self.assertEqual( self.errors, [ 'Unrecognized command in insert' ] )
+        self.assertFalse( os.path.exists(files[0].name) )
+
+    # Test values of model inserts are converted to SQLite
+    # @unittest.skip("skipped temporarily")
+    def test_InsertValues(self):
+        values = [ "0x1F", "0xF", "X'AB'", "b'0101'", "0b11", "_utf8mb4'x'", "N'y'", "_binary 0xFF", "1*2", "7/2",
+                   "1=1", "2<>3", "-1", "'it''s'", "LOWER('A')" ]
+        tbl = self.table('item', [ self.column('id'), self.column('value', '') ],
+                         inserts=''.join( "INSERT INTO `item` (`id`, `value`) VALUES (%d, %s);\n" % (i, value)
+                                          for i, value in enumerate(values) ))
+        sql = self.export(self.catalog(tbl), 'item', 'INSERT INTO')
+        self.assertEqual( sql, 'INSERT INTO "item"("id","value") VALUES\n' +
+                               ',\n'.join( '(%d,%s)' % (i, value) for i, value in enumerate([
+                                   "X'1F'", "X'0F'", "X'AB'", "5", "3", "'x'", "'y'", "X'FF'", "1*2", "7/2",
+                                   "1=1", "2<>3", "-1", "'it''s'", "LOWER('A')" ]) ) + ';\n' )
+
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.execute( 'CREATE TABLE "item"("id" INTEGER, "value")' )
+            conn.execute( sql )
+            self.assertEqual( [ value for (value,) in conn.execute( 'SELECT "value" FROM "item" ORDER BY "id"' ) ],
+                              [ b'\x1f', b'\x0f', b'\xab', 5, 3, 'x', 'y', b'\xff', 2, 3, 1, 1, -1, "it's", 'a' ] )
+        finally:
+            conn.close()
+
+    # Test narrow tables with a composite or non-integer key are created WITHOUT ROWID if enabled or hinted
+    # @unittest.skip("skipped temporarily")
+    def test_WithoutRowid(self):
+        def enrollment(name, comment='', autoIncrement=0):
+            columns = [ self.column('participant_id', autoIncrement=autoIncrement), self.column('course_id') ]
+            return self.table(name, columns, columns[:1] if autoIncrement else columns, comment=comment)
+        codeColumn = self.column('code', 'VARCHAR', isNotNull=1, length=10)
+        tables = [ enrollment('enrollment'), enrollment('visit', 'rowid'), enrollment('grade', 'Without  Rowid: grades'),
+                   self.table('course', [ self.column('id', isNotNull=1), self.column('name', 'VARCHAR', length=45) ],
+                              [ self.column('id') ]),
+                   self.table('code', [ codeColumn, self.column('value', 'TEXT') ], [ codeColumn ]),
+                   self.table('unit', [ codeColumn, self.column('factor', 'DOUBLE') ], [ codeColumn ]) ]
+        catalog = self.catalog(*tables)
+        enrollmentSql = 'CREATE TABLE "enrollment"(\n'\
+                        '  "participant_id" INTEGER%s,\n'\
+                        '  "course_id" INTEGER%s,\n'\
+                        '  PRIMARY KEY("participant_id","course_id")\n'\
+                        ')%s;\n'
+        self.assertEqual( self.export(catalog, 'enrollment'), enrollmentSql % ( '', '', '' ) )
+        self.assertTrue( self.export(catalog, 'grade').endswith('"course_id" INTEGER NOT NULL,\n'\
+                                                                '  PRIMARY KEY("participant_id","course_id")\n'\
+                                                                ') WITHOUT ROWID;\n') )
+
+        with mock.patch.object(manage_sqlite_grt, 'without_rowid_row_size', 200):
+            self.assertEqual( self.export(catalog, 'enrollment'),
+                              enrollmentSql % ( ' NOT NULL', ' NOT NULL', ' WITHOUT ROWID' ) )
+            self.assertTrue( self.export(catalog, 'visit').endswith('\n);\n') )
+            # integer keys are the rowid, unbounded values may be large
+            self.assertTrue( self.export(catalog, 'course').endswith('\n);\n') )
+            self.assertTrue( self.export(catalog, 'code').endswith('\n);\n') )
+            self.assertEqual( self.export(catalog, 'unit'), 'CREATE TABLE "unit"(\n'\
+                                                            '  "code" VARCHAR(10) PRIMARY KEY NOT NULL,\n'\
+                                                            '  "factor" DOUBLE\n'\
+                                                            ') WITHOUT ROWID;\n' )
+        with mock.patch.object(manage_sqlite_grt, 'without_rowid_row_size', 17):
+            self.assertTrue( self.export(catalog, 'unit').endswith('\n);\n') )
+
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.executescript( self.sql )
+            with self.assertRaises( sqlite3.IntegrityError ):
+                conn.execute( 'INSERT INTO "grade" VALUES (1, NULL)' )
+        finally:
+            conn.close()
+
+        self.assertEqual( manage_sqlite_grt.exportSQLite(self.catalog(enrollment('rank', 'without rowid', 1))), 1 )
+        self.assertEqual( self.errors, [ 'Table "rank" needs a primary key without AUTOINCREMENT to be created '\
+                                         'WITHOUT ROWID' ] )
+
+    # Test STRICT tables by setting or hint, with column types mapped to the STRICT types
+    # @unittest.skip("skipped temporarily")
+    def test_StrictTables(self):
+        columns = [ self.column('id', 'BIGINT', isNotNull=1), self.column('name', 'VARCHAR', length=45),
+                    self.column('state', 'ENUM', explicitParams="('new','done')"), self.column('data', 'LONGBLOB'),
+                    self.column('ratio', 'DOUBLE'), self.column('price', 'DECIMAL', explicitParams='(10,2)'),
+                    self.column('created', 'DATETIME'), self.column('anything', '') ]
+        catalog = self.catalog(self.table('item', columns, columns[:1]),
+                               self.table('tag', [ self.column('tag', 'VARCHAR', 1, length=20) ],
+                                          [ self.column('tag') ], comment='Strict, without rowid: tags of items'))
+        itemSql = 'CREATE TABLE "item"(\n'\
+                  '  "id" INTEGER PRIMARY KEY NOT NULL,\n'\
+                  '  "name" %s,\n'\
+                  '  "state" TEXT CHECK("state" IN(\'new\',\'done\')),\n'\
+                  '  "data" %s,\n'\
+                  '  "ratio" %s,\n'\
+                  '  "price" %s,\n'\
+                  '  "created" %s,\n'\
+                  '  "anything"%s\n'\
+                  ')%s;\n'
+        self.assertEqual( self.export(catalog, 'item'),
+                          itemSql % ( 'VARCHAR(45)', 'LONGBLOB', 'DOUBLE', 'DECIMAL', 'DATETIME', '', '' ) )
+        self.assertEqual( self.export(catalog, 'tag'), 'CREATE TABLE "tag"(\n'\
+                                                       '--   Strict, without rowid: tags of items\n'\
+                                                       '  "tag" TEXT PRIMARY KEY NOT NULL\n'\
+                                                       ') WITHOUT ROWID, STRICT;\n' )
+
+        with mock.patch.object(manage_sqlite_grt, 'strict_tables', True):
+            self.assertEqual( self.export(catalog, 'item'),
+                              itemSql % ( 'TEXT', 'BLOB', 'REAL', 'ANY', 'ANY', ' ANY', ' STRICT' ) )
+
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.executescript( self.sql )
+            conn.execute( 'INSERT INTO "item" VALUES (1, \'a\', \'new\', X\'00\', 0.5, 1.25, \'2024-01-01\', 1)' )
+            with self.assertRaises( sqlite3.IntegrityError ):
+                conn.execute( 'INSERT INTO "item"("id", "ratio") VALUES (2, \'half\')' )
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,13 @@
-import sys, os, re, unittest, sqlite3, copy, shutil, tempfile, logging
+import sys, os, re, unittest, sqlite3, copy, shutil, tempfile, logging, json, io, contextlib, pstats
+from random import Random
 
 # Get the current script's directory
 current_dir = os.path.dirname(os.path.abspath(__file__))# Get the parent directory by going one level up
 parent_dir = os.path.dirname(current_dir)# Add the parent directory to sys.path
 sys.path.append(parent_dir)
 
-from SQLiteDbUpdater import SQLiteDbUpdater
+import SQLiteDbUpdater as SQLiteDbUpdaterModule
+from SQLiteDbUpdater import SQLiteDbUpdater, ColInfo, TableInfo
 
 class ListHandler(logging.Handler):
     def __init__(self, logList : list[str]):
@@ -527,7 +529,7 @@ class TestSQLiteUpdater(unittest.TestCase):
         sql = re.sub( pattern, repl, sql )
 
         upater = SQLiteDbUpdater(self.dbOrigPath, sql )
-        upater.enableLogging()
+        upater.enableLogging(self.listHandler)
 
         exceptionString = ''
         try:
@@ -564,6 +566,737 @@ class TestSQLiteUpdater(unittest.TestCase):
         type = tableInfoCourse.colInfoByName['refund'].type
         self.assertEqual( type, 'NUMERIC(4,2)', "DECIMAL(4,2) should be converted to NUMERIC(4,2)" )
 
+    # Test table infos are immutable and diffed by column name
+    # @unittest.skip("skipped temporarily")
+    def test_TableInfoImmutableAndDiff(self):
+        tableInfo = TableInfo('t', [ ColInfo(0, 'id', 'INTEGER', True, None, 1),
+                                     ColInfo(1, 'name', 'VARCHAR(45)', False, None, 0) ], True)
+        otherTableInfo = TableInfo('t', [ ColInfo(0, 'id', 'INTEGER', True, None, 1),
+                                          ColInfo(1, 'name', 'TEXT', False, None, 0),
+                                          ColInfo(2, 'added', 'INT', False, None, 0) ], False)
+
+        with self.assertRaises( AttributeError ):
+            tableInfo.name = 'other'
+        with self.assertRaises( TypeError ):
+            tableInfo.colInfoByName['id'] = None
+
+        self.assertEqual( tableInfo.fingerprint, ('id', 'name') )
+        self.assertEqual( tableInfo.diff(otherTableInfo),
+                          ['col "name": type: "VARCHAR(45)" <> "TEXT"', 'col "added" not in table "t"'] )
+        self.assertEqual( tableInfo.diff(tableInfo), [] )
+
+    # Test restore plan of a dry run
+    # @unittest.skip("skipped temporarily")
+    def test_ExplainRestorePlan(self):
+        self.addSomeData(self.dbOrigFileName)
+
+        # rename participant col name and add a new table
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['participant'][1] = '"Name" VARCHAR(45)'
+        tableColsSQL['room'] = [ '"id_room" INTEGER PRIMARY KEY NOT NULL' ]
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        if os.path.isfile(updater.dbTmpFilePath):
+            os.remove(updater.dbTmpFilePath)
+        mtime = os.path.getmtime(self.dbOrigPath)
+
+        plan = updater.explain()
+
+        self.assertFalse( os.path.isfile(updater.dbTmpFilePath), 'Dry run should not create the temporary db' )
+        self.assertEqual( os.path.getmtime(self.dbOrigPath), mtime, 'Dry run should not change the db' )
+        self.assertEqual( plan.tables['course'].label, 'RowByRow(No columns changed)' )
+        self.assertEqual( plan.tables['participant'].label, 'RowByRow(Columns renamed)' )
+        self.assertEqual( plan.tables['participant'].columnMapping,
+                          { 'id_participant': 'id_participant', 'name': 'Name', 'course_id': 'course_id' } )
+        self.assertEqual( plan.tables['participant'].estimatedRows, 1 )
+        self.assertEqual( plan.createdTables, ['room'] )
+
+        planDict = json.loads( plan.toJson() )
+        self.assertEqual( planDict['renamingTableCols'], { 'participant': { 'name': 'Name' } } )
+        self.assertEqual( planDict['estimatedRows'], 2 )
+
+    # Test separate directories for temporary db and dump files
+    # @unittest.skip("skipped temporarily")
+    def test_ScratchDirectories(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+
+        with tempfile.TemporaryDirectory() as tmpDir, tempfile.TemporaryDirectory() as dumpDir:
+            updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL),
+                                      tmpDir=tmpDir, dumpDir=dumpDir)
+            updater.update()
+
+            self.assertTrue( os.path.isfile(os.path.join(dumpDir, updater.dbRestoreDataFileName)),
+                             'Dump file should be written to the dump directory' )
+            self.assertEqual( os.listdir(tmpDir), [], 'Temporary db should be moved to the db directory' )
+
+        self.assertEqual( self.getTableData( self.dbOrigFileName, "participant" ), participantOrigData,
+                         "Particpant data should not change" )
+
+        # preflight should abort before any work
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.dumpSizeFactor = 1e15
+        mtime = os.path.getmtime(self.dbOrigPath)
+        with self.assertRaises( ImportError ) as context:
+            updater.update()
+        self.assertTrue( context.exception.args[1].startswith('Not enough free space') )
+        self.assertEqual( os.path.getmtime(self.dbOrigPath), mtime, 'Db should not be touched' )
+
+    # Test headless update of many databases
+    # @unittest.skip("skipped temporarily")
+    def test_FleetUpdate(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'].append( '"Surname" VARCHAR(45)' )
+        with tempfile.TemporaryDirectory() as fleetDir, tempfile.TemporaryDirectory() as tmpDir:
+            for customer in ('a', 'b'):
+                os.mkdir( os.path.join(fleetDir, customer) )
+                shutil.copyfile( self.dbOrigPath, os.path.join(fleetDir, customer, self.dbOrigFileName) )
+            scriptPath = os.path.join(fleetDir, 'model.sql')
+            with open(scriptPath, 'w') as f:
+                f.write(self.getDbCreationSQL(tableColsSQL))
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                result = SQLiteDbUpdaterModule.main([ scriptPath, os.path.join(fleetDir, '*', '*.sqlite'),
+                                                      '--jobs', '2', '--tmp-dir', tmpDir ])
+
+            self.assertEqual( result, 0, output.getvalue() )
+            lines = output.getvalue().splitlines()
+            self.assertEqual( len(lines), 3, 'Summary should contain a header and one line per database' )
+            for customer in ('a', 'b'):
+                dbPath = os.path.join(fleetDir, customer, self.dbOrigFileName)
+                self.assertTrue( any(line.startswith(dbPath) and ' OK ' in line for line in lines) )
+                self.assertTrue( os.path.isfile(os.path.join(fleetDir, customer, 'test.log')) )
+                self.assertEqual( self.getTableData( dbPath, "participant" )[0]['Surname'], None )
+
+    # Test update by a sql creation script file
+    # @unittest.skip("skipped temporarily")
+    def test_UpdateFromSqlFile(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'].append( '"Surname" VARCHAR(45)' )
+        sql = self.getDbCreationSQL(tableColsSQL)
+        with tempfile.TemporaryDirectory() as scriptDir:
+            scriptPath = os.path.join(scriptDir, 'model.sql')
+            with open(scriptPath, 'w', encoding='utf8') as f:
+                f.write(sql)
+
+            updater = SQLiteDbUpdater.fromSqlFile(self.dbOrigPath, scriptPath)
+            updater.update()
+
+        with open(os.path.join(self.workDir, updater.dbOrigDefinitionFileName), 'r', encoding='utf8') as f:
+            self.assertEqual( f.read(), sql, 'Original definition should be a copy of the script file' )
+        self.assertEqual( self.getTableData( self.dbOrigFileName, "participant" )[0]['Surname'], None )
+
+    # Test verification of restored data
+    # @unittest.skip("skipped temporarily")
+    def test_VerifyRestoredData(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+
+        # rename participant col name
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['participant'][1] = '"Name" VARCHAR(45)'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.verifyData = True
+        updater.update()
+
+        # restore, which changes data
+        class LossyUpdater(SQLiteDbUpdater):
+            @staticmethod
+            def restoreData(dbFileName, dbDumpFileName, *args):
+                SQLiteDbUpdater.restoreData(dbFileName, dbDumpFileName, *args)
+                conn = sqlite3.connect(dbFileName)
+                conn.execute('UPDATE participant SET Name = "changed"')
+                conn.commit()
+                conn.close()
+
+        updater = LossyUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.verifyData = True
+        with self.assertRaises( ImportError ) as context:
+            updater.update()
+        self.assertEqual( context.exception.args[1],
+                          "Verification of restored data failed for tables: ['participant']!" )
+        self.assertEqual( self.getTableData( self.dbOrigFileName, "participant" )[0]['Name'], 'Shwze',
+                          'Db should not be replaced' )
+
+        # checksums distinguish storage classes and values with equal python hashes
+        checksumDbPath = os.path.join( self.workDir, 'checksum.sqlite' )
+        checksums = []
+        for values in ( '(1),(-1)', '(1.0),(-1)', "('1'),(-1)", '(1),(-2)', '(-1),(1)' ):
+            if os.path.isfile(checksumDbPath):
+                os.remove(checksumDbPath)
+            self.executeSqlScript(checksumDbPath, f'CREATE TABLE t(a); INSERT INTO t VALUES {values};')
+            checksums.append( updater.getTableChecksums(checksumDbPath, { 't': ['a'] })['t'] )
+        os.remove(checksumDbPath)
+        self.assertEqual( len(set(checksums[:4])), 4 )
+        self.assertEqual( checksums[0], checksums[4], 'Checksum should not depend on row order' )
+
+    # Test foreign key check of changed foreign keys
+    # @unittest.skip("skipped temporarily")
+    def test_CheckForeignKeys(self):
+        self.addSomeData(self.dbOrigFileName)
+        self.addTableData( self.dbOrigFileName, 'participant', [{ 'id_participant':2, 'name':'tom', 'course_id':99 }] )
+
+        # unchanged tables will not be checked
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.checkForeignKeys = True
+        updater.update()
+        self.assertEqual( updater.foreignKeyViolations, [] )
+
+        # reference the existing course table
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['participant'][2] = '"course_id" INTEGER REFERENCES course (id_course)'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.checkForeignKeys = True
+        updater.update()
+
+        self.assertEqual( updater.foreignKeyViolations, [{ 'table': 'participant', 'referencedTable': 'course',
+                                                           'columns': ['course_id'],
+                                                           'referencedColumns': ['id_course'],
+                                                           'count': 1, 'sampleRowids': [2] }] )
+
+    # Test physical settings of the old db are kept
+    # @unittest.skip("skipped temporarily")
+    def test_KeepPhysicalSettings(self):
+        os.remove( self.dbOrigPath )
+        self.executeSqlScript(self.dbOrigFileName, 'PRAGMA page_size = 8192; PRAGMA auto_vacuum = INCREMENTAL;'\
+                                                   'PRAGMA user_version = 7; PRAGMA application_id = 42;')
+        self.executeSqlScript(self.dbOrigFileName, self.getDbCreationSQL(self.tableColsSQL))
+        self.executeSqlLine(self.dbOrigFileName, 'PRAGMA journal_mode = WAL')
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.update()
+
+        settings = SQLiteDbUpdater.getDbPhysicalSettings(self.dbOrigPath)
+        self.assertEqual( settings, { 'journal_mode': 'wal', 'page_size': 8192, 'auto_vacuum': 2,
+                                      'encoding': 'UTF-8', 'user_version': 7, 'application_id': 42 } )
+        self.assertEqual( self.getTableData( self.dbOrigFileName, "participant" ), participantOrigData )
+        self.executeSqlLine(self.dbOrigFileName, 'PRAGMA journal_mode = DELETE')
+
+    # Test planner statistics are kept for unchanged tables and created for changed tables
+    # @unittest.skip("skipped temporarily")
+    def test_UpdateStatistics(self):
+        self.addSomeData(self.dbOrigFileName)
+        self.executeSqlLine(self.dbOrigFileName, 'CREATE INDEX "idx_course_name" ON "course" ("name")')
+        self.executeSqlScript(self.dbOrigFileName, 'CREATE TABLE "sqliteXlog"("id" INTEGER PRIMARY KEY, "text" TEXT);'\
+                                                   'INSERT INTO "sqliteXlog" VALUES (1, \'started\');')
+        self.executeSqlLine(self.dbOrigFileName, 'ANALYZE')
+        # fake statistics to recognize them after update
+        self.executeSqlLine(self.dbOrigFileName, "UPDATE sqlite_stat1 SET stat = '1000 10' WHERE idx = 'idx_course_name'")
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'].append('"age" INTEGER')
+        tableColsSQL['sqliteXlog'] = [ '"id" INTEGER PRIMARY KEY', '"text" TEXT', '"level" INTEGER' ]
+        sql = self.getDbCreationSQL(tableColsSQL) + 'CREATE INDEX "test"."idx_course_name" ON "course" ("name");\n'
+        updater = SQLiteDbUpdater(self.dbOrigPath, sql)
+        updater.analyze = True
+        updater.update()
+
+        conn = sqlite3.connect(self.dbOrigPath)
+        stats = { (tbl, idx): stat for tbl, idx, stat in conn.execute('SELECT tbl, idx, stat FROM sqlite_stat1') }
+        conn.close()
+        self.assertEqual( stats[('course', 'idx_course_name')], '1000 10' )
+        self.assertIn( 'participant', [ tbl for tbl, idx in stats ] )
+        self.assertIn( 'sqliteXlog', [ tbl for tbl, idx in stats ] )
+
+    # Test column transformations by sql expressions and python functions while restoring
+    # @unittest.skip("skipped temporarily")
+    def test_ColumnTransformations(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+
+        # change type of course name, rename participant name
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['course'][1] = '"name" INTEGER'
+        tableColsSQL['participant'][1] = '"Name" VARCHAR(45)'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.columnTransformations = { 'course': { 'name': 'length(name)' },
+                                          'participant': { 'Name': 'reverse(Name)' } }
+        updater.sqlFunctions = { 'reverse': lambda value: value[::-1] if isinstance(value, str) else value }
+        updater.verifyData = True
+        self.assertEqual( updater.explain().tables['participant'].transformations, { 'Name': 'reverse(Name)' } )
+        updater.update()
+
+        self.assertEqual( [ row['name'] for row in self.getTableData( self.dbOrigFileName, "course" ) ],
+                          [ len(row['name']) for row in courseOrigData ] )
+        self.assertEqual( [ row['Name'] for row in self.getTableData( self.dbOrigFileName, "participant" ) ],
+                          [ row['name'][::-1] for row in participantOrigData ] )
+
+    # Test restoring of large blobs and values which are hard to encode
+    # @unittest.skip("skipped temporarily")
+    def test_RestoreBlobsAndSpecialValues(self):
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['document'] = [ '"id_document" INTEGER PRIMARY KEY NOT NULL', '"content" BLOB', '"title" TEXT',
+                                     '"size" REAL' ]
+        os.remove( self.dbOrigPath )
+        self.executeSqlScript(self.dbOrigFileName, self.getDbCreationSQL(tableColsSQL))
+        documentOrigData = [ ( 1, os.urandom(3 * 1024 * 1024 + 17), 'None', float('inf') ),
+                             ( 2, b"\x00'\n", "line 1\nline 2\r\n'quoted';\n", -0.1 ),
+                             ( 3, None, None, None ) ]
+        conn = sqlite3.connect(self.dbOrigPath)
+        conn.executemany('INSERT INTO document VALUES (?,?,?,?)', documentOrigData)
+        conn.commit()
+        conn.close()
+
+        # add column to document
+        tableColsSQL['document'].append( '"pages" INTEGER' )
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.verifyData = True
+        updater.dumpBatchSize = 2
+        updater.update()
+
+        conn = sqlite3.connect(self.dbOrigPath)
+        documentData = conn.execute('SELECT id_document, content, title, size FROM document').fetchall()
+        conn.close()
+        self.assertEqual( documentData, documentOrigData )
+        with open(updater.getDumpFilePath(updater.dbRestoreDataFileName), 'rb') as f:
+            self.assertIn( b'zeroblob(3145745)', f.read(), 'Large blob should be copied incrementally' )
+
+    # Test rows are copied in key order of the new table
+    # @unittest.skip("skipped temporarily")
+    def test_OrderByKey(self):
+        courseNames = [ 'Zumba', 'Jump', 'Boxing', 'Yoga' ]
+        self.addTableData( self.dbOrigFileName, 'course', [ { 'id_course': idx + 1, 'name': name }
+                                                            for idx, name in enumerate(courseNames) ] )
+
+        # course name becomes primary key
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['course'] = [ '"id_course" INTEGER NOT NULL', '"name" VARCHAR(45) PRIMARY KEY' ]
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.orderByKey = True
+        updater.update()
+
+        rows = self.executeSqlLine(self.dbOrigFileName, 'SELECT name FROM course ORDER BY rowid')
+        self.assertEqual( [ row[0] for row in rows ], sorted(courseNames) )
+
+    # Test profiling of update phases
+    # @unittest.skip("skipped temporarily")
+    def test_Profile(self):
+        self.addSomeData(self.dbOrigFileName)
+
+        # rename participant col name
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['participant'][1] = '"Name" VARCHAR(45)'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.profile = True
+        updater.update()
+
+        for phaseName in [ 'create', 'plan', 'estimate', 'dump', 'restore', 'dumpViews', 'restoreViews', 'move' ]:
+            self.assertIn( phaseName, updater.phasePeakMemory )
+            profilePath = os.path.join( self.workDir, f'{self.dbOrigName}_{phaseName}' )
+            self.assertTrue( os.path.isfile( profilePath + '_alloc.txt' ) )
+            stats = pstats.Stats( profilePath + '.pstats' )
+            if phaseName == 'dump':
+                self.assertIn( 'restoreTableByRow', [ funcName for _, _, funcName in stats.stats ] )
+            os.remove( profilePath + '.pstats' )
+            os.remove( profilePath + '_alloc.txt' )
+
+    # Test tracing of sql statements
+    # @unittest.skip("skipped temporarily")
+    def test_TraceSql(self):
+        self.addSomeData(self.dbOrigFileName)
+
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.traceSql = True
+        # log all statements as slow statements
+        updater.slowStatementSeconds = 0
+        updater.update()
+
+        self.assertGreater( updater.sqlTracer.statementCount, 0 )
+        self.assertTrue( all( seconds > 0 for seconds, _, _ in updater.sqlTracer.slowStatements ) )
+        slowLogPath = os.path.join( self.workDir, updater.dbSlowLogFileName )
+        with open( slowLogPath, 'r', encoding='utf8' ) as f:
+            slowLog = f.read()
+        os.remove( slowLogPath )
+        self.assertIn( '[participant] INSERT INTO "participant" VALUES (1,\'Shwze\',1);', slowLog )
+        self.assertIn( '[course] CREATE TABLE "test"."course"', slowLog )
+
+        # other updater traced while restoring, each one traces its own statements only
+        otherDbPath = os.path.join( self.workDir, 'other.sqlite' )
+        if os.path.isfile(otherDbPath):
+            os.remove(otherDbPath)
+        otherUpdater = SQLiteDbUpdater(otherDbPath, 'ATTACH "other.sqlite" AS "other";\nBEGIN;\n'\
+                                                   'CREATE TABLE "other"."other"("id" INTEGER);\nCOMMIT;\n')
+        otherUpdater.traceSql = True
+        otherUpdater.slowStatementSeconds = 0
+
+        class OtherUpdater(SQLiteDbUpdater):
+            @staticmethod
+            def restoreData(dbFileName, dbDumpFileName, *args):
+                otherUpdater.update()
+                return SQLiteDbUpdater.restoreData(dbFileName, dbDumpFileName, *args)
+
+        updater = OtherUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.traceSql = True
+        updater.slowStatementSeconds = 0
+        updater.update()
+
+        with open( slowLogPath, 'r', encoding='utf8' ) as f:
+            slowLog = f.read()
+        os.remove( slowLogPath )
+        otherSlowLogPath = os.path.join( self.workDir, otherUpdater.dbSlowLogFileName )
+        with open( otherSlowLogPath, 'r', encoding='utf8' ) as f:
+            otherSlowLog = f.read()
+        os.remove( otherSlowLogPath )
+        os.remove( otherDbPath )
+        self.assertNotIn( '[other]', slowLog )
+        self.assertIn( '[participant] INSERT INTO "participant" VALUES (1,\'Shwze\',1);', slowLog )
+        self.assertIn( 'CREATE VIEW tln_course_s', slowLog )
+        self.assertIn( '[other] CREATE TABLE "other"', otherSlowLog )
+        self.assertNotIn( '[participant]', otherSlowLog )
+
+    # Test logging by queue to the log file and a ring buffer with pinned warnings
+    # @unittest.skip("skipped temporarily")
+    def test_LogPipeline(self):
+        self.addSomeData(self.dbOrigFileName)
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['course'][1] = '"name" TEXT'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        ringBuffer = SQLiteDbUpdaterModule.RingBufferHandler(capacity=3)
+        listMsgs = []
+        self.logMsgs.clear()
+        updater.enableLogging(ringBuffer, ListHandler(listMsgs))
+        updater.update()
+        updater.disableLogging()
+
+        # records are written by the listener only, not by handlers of parent loggers
+        self.assertEqual( self.logMsgs, [] )
+        self.assertEqual( len(listMsgs), ringBuffer.count )
+        self.assertTrue( updater.logger.propagate )
+
+        with open(updater.logFile, 'r', encoding='utf8') as f:
+            logText = f.read()
+        self.assertEqual( ringBuffer.count, len(re.findall(r'^\d\d:\d\d:\d\d ', logText, re.MULTILINE)) )
+        text = ringBuffer.getText()
+        self.assertIn( 'Type of column(s) "name" has been changed', text )
+        self.assertIn( f'... {ringBuffer.count - 3} earlier records omitted', text )
+        self.assertTrue( logText.endswith( text.split('omitted, see log file\n')[1] ) )
+
+    # Test update of indexes, views and triggers in place, if no table has changed
+    # @unittest.skip("skipped temporarily")
+    def test_UpdateInPlace(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+        inode = os.stat(self.dbOrigPath).st_ino
+
+        sql = self.getDbCreationSQL(self.tableColsSQL)
+        sql = sql.replace( 'COMMIT;', 'CREATE INDEX "test"."course.name_idx" ON "course" ("name");\n'\
+                                      'CREATE TRIGGER "test"."course_name" AFTER UPDATE ON "course" BEGIN '\
+                                      'UPDATE course SET name = upper(name) WHERE id_course = new.id_course; END;\n'\
+                                      'CREATE TRIGGER "test"."sqliteXcourse" AFTER DELETE ON "course" BEGIN '\
+                                      'DELETE FROM participant WHERE course_id = old.id_course; END;\n'\
+                                      'COMMIT;' )
+        updater = SQLiteDbUpdater(self.dbOrigPath, sql)
+        updater.inPlace = True
+        updater.update()
+
+        self.assertEqual( os.stat(self.dbOrigPath).st_ino, inode, 'Db should be updated in place' )
+        schemaObjects = SQLiteDbUpdater.getDbSchemaObjects(self.dbOrigPath)
+        self.assertIn( 'course_name_idx', schemaObjects['index'] )
+        self.assertEqual( sorted(schemaObjects['trigger']), [ 'course_name', 'sqliteXcourse' ] )
+        self.assertEqual( sorted(schemaObjects['view']), [ 'tln_course_s', 'tln_course_t' ], 'Views should be kept' )
+        self.assertEqual( self.getTableData( self.dbOrigFileName, "participant" ), participantOrigData )
+
+        # remove index and trigger again
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.inPlace = True
+        updater.update()
+        schemaObjects = SQLiteDbUpdater.getDbSchemaObjects(self.dbOrigPath)
+        self.assertNotIn( 'course_name_idx', schemaObjects['index'] )
+        self.assertEqual( schemaObjects['trigger'], {} )
+        self.assertEqual( os.stat(self.dbOrigPath).st_ino, inode, 'Db should be updated in place' )
+
+        # changed tables need a rebuild
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['course'].append( '"room" VARCHAR(45)' )
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.inPlace = True
+        updater.update()
+        self.assertNotEqual( os.stat(self.dbOrigPath).st_ino, inode, 'Db should be rebuilt' )
+
+    # Test publishing the temporary db into a db, which is kept open
+    # @unittest.skip("skipped temporarily")
+    def test_PublishByBackup(self):
+        courseOrigData, participantOrigData = self.addSomeData(self.dbOrigFileName)
+        inode = os.stat(self.dbOrigPath).st_ino
+        reader = sqlite3.connect(self.dbOrigPath)
+        self.assertEqual( len(reader.execute('SELECT * FROM participant').fetchone()), 3 )
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'].append( '"Surname" VARCHAR(45)' )
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.publishMode = 'backup'
+        updater.update()
+
+        self.assertEqual( reader.execute('SELECT * FROM participant').fetchone(), (1, 'Shwze', 1, None),
+                          'Open connection should see the new schema' )
+        reader.close()
+        self.assertEqual( os.stat(self.dbOrigPath).st_ino, inode, 'Db file should be kept' )
+        self.assertFalse( os.path.isfile(updater.dbTmpFilePath) )
+
+    # Test changes of the old db while rebuilding are replayed
+    # @unittest.skip("skipped temporarily")
+    def test_CaptureChanges(self):
+        self.addSomeData(self.dbOrigFileName)
+        self.addTableData( self.dbOrigFileName, 'participant', [ { 'id_participant': 2, 'name': 'Tom', 'course_id': 1 },
+                                                                 { 'id_participant': 3, 'name': 'Ann', 'course_id': 1 } ] )
+
+        # other application writing to the old db while restoring
+        class ConcurrentUpdater(SQLiteDbUpdater):
+            @staticmethod
+            def restoreData(dbFileName, dbDumpFileName, *args):
+                SQLiteDbUpdater.restoreData(dbFileName, dbDumpFileName, *args)
+                conn = sqlite3.connect(updater.dbFilePath)
+                conn.execute('INSERT INTO participant VALUES (4, "Bob", 1)')
+                conn.execute('UPDATE participant SET name = "Tim" WHERE id_participant = 2')
+                conn.execute('DELETE FROM participant WHERE id_participant = 3')
+                conn.execute('UPDATE course SET name = "Run"')
+                conn.commit()
+                conn.close()
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'][1] = '"Name" VARCHAR(45)'
+        updater = ConcurrentUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.captureChanges = True
+        updater.update()
+
+        self.assertEqual( self.executeSqlLine(self.dbOrigFileName, 'SELECT * FROM participant ORDER BY 1'),
+                          [ (1, 'Shwze', 1), (2, 'Tim', 1), (4, 'Bob', 1) ] )
+        self.assertEqual( self.executeSqlLine(self.dbOrigFileName, 'SELECT name FROM course'), [ ('Run',) ] )
+        self.assertNotIn( updater.captureTableName, SQLiteDbUpdater.getDbTableInfo(self.dbOrigPath) )
+
+        # capture is removed from the old db, if the update fails
+        class FailingUpdater(SQLiteDbUpdater):
+            @staticmethod
+            def restoreData(dbFileName, dbDumpFileName, *args):
+                raise ImportError('Error', 'Restore failed')
+
+        updater = FailingUpdater(self.dbOrigPath, self.getDbCreationSQL(self.tableColsSQL))
+        updater.captureChanges = True
+        with self.assertRaises( ImportError ):
+            updater.update()
+        self.assertEqual( SQLiteDbUpdater.getDbSchemaObjects(self.dbOrigPath)['trigger'], {} )
+        self.assertNotIn( updater.captureTableName, SQLiteDbUpdater.getDbTableInfo(self.dbOrigPath) )
+
+    # Test changes of rows with blob, real and text keys of a table with quote in its name are captured and replayed
+    # @unittest.skip("skipped temporarily")
+    def test_CaptureChangesBlobKey(self):
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL["user's token"] = [ '"key" BLOB NOT NULL', '"part" NOT NULL', '"value" TEXT', 'PRIMARY KEY("key", "part")' ]
+        os.remove( self.dbOrigPath )
+        self.executeSqlScript(self.dbOrigFileName, self.getDbCreationSQL(tableColsSQL))
+        self.executeSqlScript(self.dbOrigFileName, "INSERT INTO \"user's token\" VALUES (X'00FF', 0.1, 'a');"\
+                                                   "INSERT INTO \"user's token\" VALUES (X'27', 'it''s, \"1\"', 'b');"\
+                                                   "INSERT INTO \"user's token\" VALUES (X'', -7, 'c');")
+
+        class ConcurrentUpdater(SQLiteDbUpdater):
+            @staticmethod
+            def restoreData(dbFileName, dbDumpFileName, *args):
+                SQLiteDbUpdater.restoreData(dbFileName, dbDumpFileName, *args)
+                conn = sqlite3.connect(updater.dbFilePath)
+                conn.execute( "INSERT INTO \"user's token\" VALUES (X'0102', 1e300, 'd')" )
+                conn.execute( "UPDATE \"user's token\" SET value = 'e' WHERE key = X'00FF'" )
+                conn.execute( "UPDATE \"user's token\" SET value = 'f' WHERE key = X'27'" )
+                conn.execute( "DELETE FROM \"user's token\" WHERE key = X''" )
+                conn.commit()
+                conn.close()
+
+        # the renamed table name is not valid in the new db, but is used by the capture triggers of the old db
+        tableColsSQL['token'] = tableColsSQL.pop("user's token")
+        updater = ConcurrentUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.captureChanges = True
+        updater.update()
+
+        self.assertEqual( self.executeSqlLine(self.dbOrigFileName, 'SELECT * FROM token ORDER BY 1'),
+                          [ (b'\x00\xff', 0.1, 'e'), (b'\x01\x02', 1e300, 'd'), (b"'", 'it\'s, "1"', 'f') ] )
+
+    # Test rows violating new constraints are quarantined
+    # @unittest.skip("skipped temporarily")
+    def test_QuarantineRows(self):
+        self.addSomeData(self.dbOrigFileName)
+        self.executeSqlScript(self.dbOrigFileName, 'INSERT INTO participant VALUES (2, NULL, 1);'\
+                                                   'INSERT INTO participant VALUES (3, "Tom", 1);'\
+                                                   'INSERT INTO participant VALUES (4, "Ann", 1);'\
+                                                   'INSERT INTO participant VALUES (5, NULL, 1);')
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'][1] = '"name" VARCHAR(45) NOT NULL'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.dumpBatchSize = 3
+        with self.assertRaises( ImportError ) as context:
+            updater.update()
+        self.assertEqual( context.exception.args[1], 'Restoring of table "participant" failed: NOT NULL constraint '\
+                                                     'failed: participant.name, row: (2,NULL,1)' )
+
+        updater.quarantineRows = True
+        updater.update()
+        self.assertEqual( updater.quarantinedRows, 2 )
+        self.assertEqual( [ row['id_participant'] for row in self.getTableData(self.dbOrigFileName, 'participant') ],
+                          [ 1, 3, 4 ] )
+        with open( updater.getDumpFilePath(updater.dbQuarantineFileName), 'r', encoding='utf8' ) as f:
+            self.assertEqual( f.read(), '-- participant: NOT NULL constraint failed: participant.name\n'\
+                                        'INSERT INTO "participant"("id_participant","name","course_id") VALUES\n(2,NULL,1);\n'\
+                                        '-- participant: NOT NULL constraint failed: participant.name\n'\
+                                        'INSERT INTO "participant"("id_participant","name","course_id") VALUES\n'\
+                                        '(5,NULL,1);\n' )
+
+    # Test quarantined rows of transformed tables are labeled by their table, not by sql in their values
+    # @unittest.skip("skipped temporarily")
+    def test_QuarantineTransformedRows(self):
+        self.addSomeData(self.dbOrigFileName)
+        self.executeSqlScript(self.dbOrigFileName, 'INSERT INTO participant VALUES (2, \'INSERT INTO "course"\', 1);'\
+                                                   'INSERT INTO participant VALUES (3, NULL, 1);')
+
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['participant'][1] = '"name" VARCHAR(45) NOT NULL'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.columnTransformations = { 'participant': { 'name': 'lower("name")' } }
+        updater.quarantineRows = True
+        updater.update()
+
+        self.assertEqual( updater.quarantinedRows, 1 )
+        self.assertEqual( self.executeSqlLine(self.dbOrigFileName, 'SELECT name FROM participant ORDER BY 1'),
+                          [ ('insert into "course"',), ('shwze',) ] )
+        with open( updater.getDumpFilePath(updater.dbQuarantineFileName), 'r', encoding='utf8' ) as f:
+            self.assertTrue( f.read().startswith('-- participant: NOT NULL constraint failed: participant.name\n') )
+
+    # Test blobs of quarantined rows are written to the quarantine file, blobs checked by the new table are not streamed
+    # @unittest.skip("skipped temporarily")
+    def test_QuarantineStreamedBlobs(self):
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['document'] = [ '"id_document" INTEGER PRIMARY KEY NOT NULL', '"content" BLOB', '"title" TEXT' ]
+        os.remove( self.dbOrigPath )
+        self.executeSqlScript(self.dbOrigFileName, self.getDbCreationSQL(tableColsSQL))
+        documentOrigData = [ ( 1, os.urandom(3000), 'a' ), ( 2, os.urandom(2000), None ), ( 3, b'\x00', 'c' ) ]
+        conn = sqlite3.connect(self.dbOrigPath)
+        conn.executemany('INSERT INTO document VALUES (?,?,?)', documentOrigData)
+        conn.commit()
+        conn.close()
+
+        tableColsSQL['document'][2] = '"title" TEXT NOT NULL'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.blobStreamThreshold = 1024
+        updater.quarantineRows = True
+        updater.update()
+
+        self.assertEqual( updater.quarantinedRows, 1 )
+        conn = sqlite3.connect(self.dbOrigPath)
+        self.assertEqual( conn.execute('SELECT * FROM document').fetchall(), [ documentOrigData[0], documentOrigData[2] ] )
+        conn.close()
+        with open( updater.getDumpFilePath(updater.dbQuarantineFileName), 'r', encoding='utf8' ) as f:
+            quarantineSql = f.read()
+        self.assertEqual( quarantineSql, '-- document: NOT NULL constraint failed: document.title\n'\
+                                         'INSERT INTO "document"("rowid","id_document","content","title") VALUES\n'\
+                                         '(2,2,zeroblob(2000),NULL);\n'\
+                                         '-- document: blob of quarantined row\n'\
+                                         f'UPDATE "document" SET "content" = X\'{documentOrigData[1][1].hex()}\' '\
+                                         'WHERE rowid = 2;\n' )
+        conn = sqlite3.connect(':memory:')
+        conn.execute( 'CREATE TABLE "document"("id_document" INTEGER PRIMARY KEY, "content" BLOB, "title" TEXT)' )
+        conn.executescript( quarantineSql )
+        self.assertEqual( conn.execute('SELECT * FROM document').fetchall(), [ documentOrigData[1] ] )
+        conn.close()
+
+        # CHECK constraints, triggers and indexes of the new table would see the placeholders
+        tableColsSQL['document'][2] = '"title" TEXT'
+        for tableColSQL, extraSql in ( ( '"content" BLOB CHECK(length("content") > 0)', '' ),
+                                       ( '"content" BLOB', 'CREATE TRIGGER "test"."document_insert" AFTER INSERT '\
+                                                           'ON "document" BEGIN SELECT 1; END;\n' ),
+                                       ( '"content" BLOB', 'CREATE INDEX "test"."document_content_idx" '\
+                                                           'ON "document" ("content");\n' ) ):
+            tableColsSQL['document'][1] = tableColSQL
+            updater = SQLiteDbUpdater(self.dbOrigPath,
+                                      self.getDbCreationSQL(tableColsSQL).replace('COMMIT;\n', extraSql + 'COMMIT;\n'))
+            updater.blobStreamThreshold = 1024
+            updater.update()
+
+            conn = sqlite3.connect(self.dbOrigPath)
+            self.assertEqual( conn.execute('SELECT * FROM document').fetchall(),
+                              [ documentOrigData[0], documentOrigData[2] ] )
+            conn.close()
+            with open(updater.getDumpFilePath(updater.dbRestoreDataFileName), 'rb') as f:
+                self.assertNotIn( b'zeroblob', f.read() )
+
+    # Test large blobs are only streamed, if the rowid alias of the new table keeps the old rowid
+    # @unittest.skip("skipped temporarily")
+    def test_StreamedBlobsKeyNotRowid(self):
+        tableColsSQL = copy.deepcopy( self.tableColsSQL )
+        tableColsSQL['document'] = [ '"id_document" INTEGER NOT NULL', '"content" BLOB' ]
+        os.remove( self.dbOrigPath )
+        self.executeSqlScript(self.dbOrigFileName, self.getDbCreationSQL(tableColsSQL))
+        documentOrigData = [ ( 100, os.urandom(3000) ), ( 50, os.urandom(2000) ) ]
+        conn = sqlite3.connect(self.dbOrigPath)
+        conn.executemany('INSERT INTO document VALUES (?,?)', documentOrigData)
+        conn.commit()
+        conn.close()
+
+        tableColsSQL['document'][0] = '"id_document" INTEGER PRIMARY KEY NOT NULL'
+        updater = SQLiteDbUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.blobStreamThreshold = 1024
+        updater.update()
+
+        self.assertEqual( self.executeSqlLine(self.dbOrigFileName, 'SELECT * FROM document ORDER BY rowid DESC'),
+                          documentOrigData )
+        with open(updater.getDumpFilePath(updater.dbRestoreDataFileName), 'rb') as f:
+            self.assertNotIn( b'zeroblob', f.read() )
+
+        # now the key is the rowid alias of both tables and blobs are streamed, a missing row is an error
+        class MissingRowUpdater(SQLiteDbUpdater):
+            @staticmethod
+            def restoreData(dbFileName, dbDumpFileName, *args):
+                quarantinedRows = SQLiteDbUpdater.restoreData(dbFileName, dbDumpFileName, *args)
+                conn = sqlite3.connect(dbFileName)
+                conn.execute('DELETE FROM document WHERE id_document = 50')
+                conn.commit()
+                conn.close()
+                return quarantinedRows
+
+        updater = MissingRowUpdater(self.dbOrigPath, self.getDbCreationSQL(tableColsSQL))
+        updater.blobStreamThreshold = 1024
+        with self.assertRaises( ImportError ) as context:
+            updater.update()
+        self.assertEqual( context.exception.args[1], 'Row 50 of table "document" is missing, blob of column "content" '\
+                                                     'can\'t be copied' )
+
+    # Test rebuild of a table as WITHOUT ROWID and STRICT table
+    # @unittest.skip("skipped temporarily")
+    def test_WithoutRowidAndStrict(self):
+        tableColsSQL = copy.deepcopy(self.tableColsSQL)
+        tableColsSQL['enrollment'] = [
+            '"participant_id" INTEGER NOT NULL REFERENCES participant (id_participant)',
+            '"course_id" INTEGER NOT NULL',
+            '"note" VARCHAR(45)',
+            'PRIMARY KEY("participant_id","course_id")' ]
+        os.remove( self.dbOrigPath )
+        self.executeSqlScript(self.dbOrigFileName, self.getDbCreationSQL(tableColsSQL))
+        self.addSomeData(self.dbOrigFileName)
+        self.executeSqlScript(self.dbOrigFileName, 'INSERT INTO enrollment VALUES (1, 1, "paid");'\
+                                                   'INSERT INTO enrollment VALUES (1, "two", NULL);'\
+                                                   'INSERT INTO enrollment VALUES (9, 1, NULL);')
+
+        tableColsSQL['enrollment'][2] = '"note" TEXT'
+        sql = self.getDbCreationSQL(tableColsSQL).replace( '"course_id"));\n',
+                                                           '"course_id")) WITHOUT ROWID, STRICT;\n' )
+        updater = SQLiteDbUpdater(self.dbOrigPath, sql)
+        updater.quarantineRows = True
+        updater.checkForeignKeys = True
+        updater.update()
+
+        conn = sqlite3.connect(self.dbOrigPath)
+        try:
+            self.assertFalse( SQLiteDbUpdater.hasRowid(conn, 'enrollment') )
+        finally:
+            conn.close()
+        self.assertEqual( updater.quarantinedRows, 1 )
+        self.assertEqual( [ ( row['participant_id'], row['course_id'], row['note'] )
+                            for row in self.getTableData(self.dbOrigFileName, 'enrollment') ],
+                          [ (1, 1, 'paid'), (9, 1, None) ] )
+        self.assertEqual( updater.foreignKeyViolations, [{ 'table': 'enrollment', 'referencedTable': 'participant',
+                                                           'columns': ['participant_id'],
+                                                           'referencedColumns': ['id_participant'],
+                                                           'count': 1, 'sampleRowids': [] }] )
+
     # Test for schema count
     # @unittest.skip("skipped temporarily")
     def test_DenyMoreThanOneSchema(self):
@@ -645,6 +1378,165 @@ class TestSQLiteUpdater(unittest.TestCase):
         self.assertEqual(self.logMsgs[1], 'Table "Gebuehr" fingerprint has been changed (col "Betrag": type: "NUMERIC(5,2)" <> "DECIMAL"), maybe data will be not restored correctly!')
         self.assertEqual(self.logMsgs[2], 'Type of column(s) "Betrag" has been changed, if restoring of data leads to problems, adapt data before change the datatype!')
 
+# Randomized differential test of the restore options ("engines") against the reference restore,
+# each engine has to restore the data expected by the model change, row by row identical to the reference
+class TestRestoreFuzz(unittest.TestCase):
+    iterations = 20
+    engines = {
+        'reference': {},
+        'batched': { 'dumpBatchSize': 3 },
+        'orderByKey': { 'orderByKey': True },
+        'blobStreaming': { 'blobStreamThreshold': 16, 'blobChunkSize': 7 },
+        'checked': { 'verifyData': True, 'checkForeignKeys': True, 'analyze': True },
+        'transformed': {}
+    }
+    colNames = [ 'name', 'order', 'select', 'group', 'key', 'None', 'NULL', 'values', 'value', 'from', 'where',
+                 'table', 'index', 'data', 'size', 'Größe', 'Straße', 'x-y', 'a+b', 'count' ]
+    colTypes = [ 'INTEGER', 'REAL', 'TEXT', 'BLOB', 'NUMERIC', 'VARCHAR(45)', '' ]
+    values = [ None, 0, -1, 1, 2**63 - 1, -2**63, 1.5, -0.0, 1e300, float('inf'), float('-inf'), float('nan'),
+               '', 'None', 'NULL', "O'Brien", "''", '"', 'a;\nb', 'line 1\r\nline 2', 'tab\tnul\x00end', 'Ümlaut ß €',
+               '1', '1.0', ' 2 ', 'X\'00\'', b'', b'\x00', b"\x00'\n;", bytes(range(256)), b'None' ]
+
+    def setUp(self):
+        self.workDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+
+    def randomValue(self, random):
+        if random.random() < 0.1:
+            return random.randbytes(random.randint(17, 64))
+        return random.choice(self.values)
+
+    # table given as list of (column name, type), the first column is the primary key or a plain key column
+    @staticmethod
+    def getTableSQL(tableName, cols, isPrimaryKey=True):
+        colDefs = [ f'"{colName}" {colType}'.strip() for colName, colType in cols ]
+        colDefs[0] += ' PRIMARY KEY NOT NULL' if isPrimaryKey else ' NOT NULL'
+        return f'CREATE TABLE {tableName}(\n' + ',\n'.join(colDefs) + ');\n'
+
+    # creation sql of tables given as table name -> list of (column name, type)
+    @staticmethod
+    def getCreationSQL(dbName, tables):
+        sql = f'ATTACH "{dbName}.sqlite" AS "{dbName}";\nBEGIN;\n'
+        for tableName, cols in tables.items():
+            sql += TestRestoreFuzz.getTableSQL(f'"{dbName}"."{tableName}"', cols)
+        return sql + 'COMMIT;\n'
+
+    @staticmethod
+    def getDbData(dbPath):
+        conn = sqlite3.connect(dbPath)
+        try:
+            data = {}
+            for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND "\
+                                        "name NOT LIKE 'sqlite_%' ORDER BY name"):
+                cols = [ row[1] for row in conn.execute(f'PRAGMA table_info("{name}")') ]
+                rows = conn.execute(f'SELECT * FROM "{name}" ORDER BY 1').fetchall()
+                data[name] = ( cols, [ tuple( (type(val).__name__, val) for val in row ) for row in rows ] )
+            return data
+        finally:
+            conn.close()
+
+    # random change of a table, returns new columns and new column name -> old column name
+    def changeTable(self, random, cols, unusedColNames):
+        change = random.choice([ 'none', 'add', 'remove', 'move', 'rename' ])
+        newCols = list(cols)
+        if change == 'add':
+            newCols.insert( random.randint(1, len(cols)), (unusedColNames.pop(), random.choice(self.colTypes)) )
+        elif change == 'remove' and len(cols) > 2:
+            del newCols[random.randint(1, len(cols) - 1)]
+        elif change == 'move' and len(cols) > 2:
+            idx = random.randint(1, len(cols) - 1)
+            newCols.insert( random.randint(1, len(cols) - 1), newCols.pop(idx) )
+        elif change == 'rename':
+            idx = random.randint(1, len(cols) - 1)
+            newCols[idx] = ( unusedColNames.pop(), cols[idx][1] )
+        oldNames = { colName for colName, _ in cols }
+        mapping = { newName: newName for newName, _ in newCols if newName in oldNames }
+        if change == 'rename':
+            mapping[newCols[idx][0]] = cols[idx][0]
+        return newCols, mapping
+
+    def runIteration(self, seed):
+        random = Random(seed)
+        unusedColNames = random.sample(self.colNames, len(self.colNames))
+        dbName = 'fuzz'
+        oldTables, newTables, tableMappings = {}, {}, {}
+        for tableIdx in range(random.randint(1, 3)):
+            tableName = f'table{tableIdx}'
+            cols = [ (f'id_{tableName}', 'INTEGER') ] + [ (unusedColNames.pop(), random.choice(self.colTypes))
+                                                          for _ in range(random.randint(1, 4)) ]
+            oldTables[tableName] = cols
+        for tableName, cols in oldTables.items():
+            newCols, mapping = self.changeTable(random, cols, unusedColNames)
+            # renamed tables keep their columns
+            newTableName = tableName
+            if newCols == cols and random.random() < 0.3:
+                newTableName = tableName + '_renamed'
+            newTables[newTableName] = newCols
+            tableMappings[newTableName] = ( tableName, mapping )
+
+        origDir = os.path.join(self.workDir, f'orig{seed}')
+        os.mkdir(origDir)
+        origPath = os.path.join(origDir, f'{dbName}.sqlite')
+        conn = sqlite3.connect(origPath)
+        for tableName, cols in oldTables.items():
+            # keys, which are no rowid alias in the old table, differ from the rowid
+            conn.execute( self.getTableSQL(f'"{tableName}"', cols, random.random() < 0.7) )
+            rows = [ [ rowIdx + 1 ] + [ self.randomValue(random) for _ in cols[1:] ]
+                     for rowIdx in random.sample(range(100), random.randint(0, 12)) ]
+            conn.executemany( f'INSERT INTO "{tableName}" VALUES ({",".join("?" * len(cols))})', rows )
+            if random.random() < 0.5:
+                conn.execute( f'CREATE VIEW "view_{tableName}" AS SELECT * FROM "{tableName}"' )
+            elif random.random() < 0.5:
+                # columns qualified by table name, restricted to columns which are kept
+                newTableName = [ name for name, (oldName, _) in tableMappings.items() if oldName == tableName ][0]
+                viewCols = [ f'"{tableName}"."{oldColName}"' for oldColName in tableMappings[newTableName][1].values() ]
+                conn.execute( f'CREATE VIEW "view_{tableName}" AS SELECT {", ".join(viewCols)} FROM "{tableName}"' )
+        conn.commit()
+        conn.close()
+
+        # expected data derived from the stored data of the original db
+        origData = self.getDbData(origPath)
+        expectedData = {}
+        for newTableName, newCols in newTables.items():
+            oldTableName, mapping = tableMappings[newTableName]
+            oldColNames, oldRows = origData[oldTableName]
+            rows = []
+            for oldRow in oldRows:
+                rows.append( tuple( oldRow[oldColNames.index(mapping[colName])] if colName in mapping
+                                    else ('NoneType', None) for colName, _ in newCols ) )
+            expectedData[newTableName] = ( [ colName for colName, _ in newCols ], rows )
+
+        sql = self.getCreationSQL(dbName, newTables)
+        referenceData = None
+        for engineName, options in self.engines.items():
+            engineDir = os.path.join(self.workDir, f'{engineName}{seed}')
+            os.mkdir(engineDir)
+            dbPath = os.path.join(engineDir, f'{dbName}.sqlite')
+            shutil.copyfile(origPath, dbPath)
+            updater = SQLiteDbUpdater(dbPath, sql)
+            for name, value in options.items():
+                setattr(updater, name, value)
+            if engineName == 'transformed':
+                updater.columnTransformations = { tableName: { colName: f'"{colName}"' for colName, _ in cols }
+                                                  for tableName, cols in newTables.items() }
+            updater.update()
+            self.assertEqual( updater.foreignKeyViolations, [] )
+
+            data = self.getDbData(dbPath)
+            msg = f'seed {seed}, engine {engineName}, tables {oldTables} -> {newTables}'
+            for tableName, expected in expectedData.items():
+                self.assertEqual( data[tableName], expected, msg )
+            if referenceData is None:
+                referenceData = data
+            self.assertEqual( data, referenceData, msg )
+
+    def test_RestoreEngines(self):
+        for seed in range(self.iterations):
+            with self.subTest(seed=seed):
+                self.runIteration(seed)
+
 
 if __name__ == '__main__':
     unittest.main()
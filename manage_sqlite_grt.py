@@ -22,6 +22,9 @@
 import os
 import re
 import sys
+import shutil
+import tempfile
+from collections import deque
 from io import StringIO
 import logging
 
@@ -37,6 +40,95 @@ ModuleInfo = DefineModule(name='ExportSQLite',
                           author='Tatsushi Demachi',
                           version='0.1.0')
 
+# Tokens of the MySQL INSERT statements of the model (tbl.inserts())
+mysql_token_re = re.compile(r"""
+      (?P<space>\s+)
+    | (?P<ident>`(?:[^`]|``)*`)
+    | (?P<hex>[xX]'[0-9a-fA-F]*'|0x[0-9a-fA-F]+)
+    | (?P<bit>[bB]'[01]*'|0b[01]+)
+    | (?P<introducer>_[A-Za-z0-9]+(?=\s*(?:['"]|[xXbB]'|0[xb]))|[nN](?='))
+    | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<symbol>[-+*/%=<>!&|^~(),.;:])
+    """, re.VERBOSE | re.DOTALL)
+
+# MySQL string escape sequences, other escaped characters stand for themselves
+mysql_escapes = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t',
+                 'Z': '\x1a', '%': '\\%', '_': '\\_'}
+
+# Number of rows in one generated multi-row INSERT
+insert_batch_size = 500
+
+# Tables with a composite or non-integer primary key are created WITHOUT ROWID,
+# if their rows are estimated up to this number of bytes, 0 disables it. The
+# table comment hints "rowid" or "without rowid" decide it per table. Primary
+# key columns of WITHOUT ROWID tables are NOT NULL, so e.g. 200 is opt-in
+without_rowid_row_size = 0
+
+# Create all tables STRICT, otherwise only tables with the comment hint "strict"
+strict_tables = False
+
+# Scripts up to this number of characters are shown and editable in the
+# wizard, larger ones are only previewed and used from the generated file
+preview_chars = 256 * 1024
+
+# Number of latest log records shown after creating/updating a database
+log_buffer_size = 1000
+
+# Snapshot of each table, kept for the whole Workbench session, so only
+# changed tables have to be read through GRT again.
+# table object id -> (change signature, table record)
+table_record_cache = {}
+
+# Generated SQL of each table, kept for the whole Workbench session, so only
+# changed tables have to be generated again.
+# (db_name, schema name, table name) -> (table record, export settings, SQL)
+table_sql_cache = {}
+
+class Record(object):
+    """Plain Python copy of a GRT object. Records are compared by value, so
+    the snapshot of a table is the signature of its generated SQL
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.values())
+
+class SchemaRecord(Record):
+    __slots__ = ('name', 'comment', 'tables')
+
+class TableRecord(Record):
+    __slots__ = ('name', 'comment', 'columns', 'indices', 'foreign_keys',
+                 'inserts')
+
+class ColumnRecord(Record):
+    __slots__ = ('name', 'type_name', 'flags', 'length', 'explicit_params',
+                 'is_not_null', 'auto_increment', 'default_value', 'comment')
+
+class IndexRecord(Record):
+    __slots__ = ('name', 'index_type', 'is_primary', 'columns')
+
+class IndexColumnRecord(Record):
+    __slots__ = ('name', 'descend')
+
+class ForeignKeyRecord(Record):
+    __slots__ = ('name', 'columns', 'referenced_table', 'referenced_columns',
+                 'delete_rule', 'update_rule', 'comment')
+
 @ModuleInfo.plugin('wb.util.exportSQLite',
                    caption='Manage SQLite',
                    input=[wbinputs.currentCatalog()],
@@ -47,14 +139,97 @@ def exportSQLite(cat):
     of table-objects
     """
 
-    def validate_for_sqlite_export(cat):
+    def snapshot_catalog(cat):
+        """Copy all schemata of the catalog into records in one pass, every
+        GRT attribute used by the export is read exactly once. Tables which
+        have not been changed since the last export are taken from the cache
+        """
+        def snapshot_column(column):
+            simple_type = column.simpleType
+            type_name = (simple_type.name if simple_type else
+                         column.userType.name)
+            return ColumnRecord(column.name,
+                                type_name,
+                                tuple(column.flags),
+                                column.length,
+                                column.datatypeExplicitParams,
+                                column.isNotNull,
+                                column.autoIncrement,
+                                column.defaultValue,
+                                column.comment)
+
+        def snapshot_index(index):
+            return IndexRecord(index.name,
+                               index.indexType,
+                               index.isPrimary,
+                               tuple(IndexColumnRecord(
+                                         column.referencedColumn.name,
+                                         column.descend)
+                                     for column in index.columns))
+
+        def snapshot_foreign_key(fkey):
+            return ForeignKeyRecord(fkey.name,
+                                    tuple(column.name for column in fkey.columns),
+                                    fkey.referencedTable.name,
+                                    tuple(column.name for column in
+                                          fkey.referencedColumns),
+                                    fkey.deleteRule,
+                                    fkey.updateRule,
+                                    fkey.comment)
+
+        def snapshot_table(tbl):
+            return TableRecord(tbl.name,
+                               tbl.comment,
+                               tuple(snapshot_column(column)
+                                     for column in tbl.columns),
+                               tuple(snapshot_index(index)
+                                     for index in tbl.indices),
+                               tuple(snapshot_foreign_key(fkey)
+                                     for fkey in tbl.foreignKeys),
+                               tbl.inserts())
+
+        def table_change_signature(tbl):
+            """Workbench updates lastChangeDate of a table on every change of
+            it or its columns, indices and foreign keys, but not if a
+            referenced table or column is renamed or the inserts are edited
+            """
+            return (tbl.lastChangeDate,
+                    tuple((fkey.referencedTable.name,
+                           tuple(column.name for column in
+                                 fkey.referencedColumns))
+                          for fkey in tbl.foreignKeys),
+                    tbl.inserts())
+
+        def cached_table(tbl):
+            key = tbl.__id__
+            snapshot_tables.add(key)
+            signature = table_change_signature(tbl)
+            cached = table_record_cache.get(key)
+            if cached is None or cached[0] != signature:
+                cached = (signature, snapshot_table(tbl))
+                table_record_cache[key] = cached
+            return cached[1]
+
+        snapshot_tables = set()
+        schemata = [SchemaRecord(schema.name,
+                                 schema.comment,
+                                 tuple(cached_table(tbl) for tbl in schema.tables))
+                    for schema in cat.schemata]
+
+        # forget tables, which do not exist anymore
+        for key in set(table_record_cache) - snapshot_tables:
+            del table_record_cache[key]
+
+        return schemata
+
+    def validate_for_sqlite_export(schemata):
         """Check uniqueness of schema, table and index names. Return 0 on
         success otherwise return 1 (the export process should abort)
         """
 
         have_errors = False
         idt = {}
-        for i, schema in enumerate(cat.schemata):
+        for i, schema in enumerate(schemata):
             if schema.name in idt:
                 have_errors = True
                 if grt.modules.Workbench.confirm('Name conflict',
@@ -70,7 +245,7 @@ def exportSQLite(cat):
         if have_errors:
             return False
 
-        for schema in cat.schemata:
+        for schema in schemata:
             idt = {}
             for i, tbl in enumerate(schema.tables):
                 if tbl.name == '':
@@ -96,7 +271,7 @@ def exportSQLite(cat):
         if have_errors:
             return False
 
-        for schema in cat.schemata:
+        for schema in schemata:
             for tbl in schema.tables:
                 idt = {}
                 for i, column in enumerate(tbl.columns):
@@ -127,7 +302,7 @@ def exportSQLite(cat):
                 # Now check indices (except primary/unique)
                 idt = {}
                 for i, index in enumerate(tbl.indices):
-                    if index.indexType == 'INDEX':
+                    if index.index_type == 'INDEX':
                         if index.name == '':
                             have_errors = True
                             if grt.modules.Workbench.confirm('Name conflict',
@@ -163,44 +338,134 @@ def exportSQLite(cat):
         return fkey.comment.lstrip().lower()[0:5] == 'defer'
 
     def export_table(out, db_name, schema, tbl):
+        """Write SQL of table, generate it only if the table has been changed
+        since the last export
+        """
+        key = (db_name, schema.name, tbl.name)
+        exported_tables.add(key)
+        # the generated SQL depends on these module settings as well
+        settings = (insert_batch_size, without_rowid_row_size, strict_tables)
+        cached = table_sql_cache.get(key)
+        if cached is None or cached[0] != tbl or cached[1] != settings:
+            table_out = StringIO()
+            generate_table_sql(table_out, db_name, schema, tbl)
+            cached = (tbl, settings, table_out.getvalue())
+            table_sql_cache[key] = cached
+        out.write(cached[2])
+
+    def table_hints(tbl):
+        # Hack like is_deferred: if comment starts with "strict", "rowid" or
+        # "without rowid" (e.g. "Strict, without rowid: ...") the table is
+        # created with these options
+        match = re.match(r'\s*(?:(?:without\s+rowid|rowid|strict)\b[\s,;:]*)+',
+                         tbl.comment.lower())
+        if match is None:
+            return set()
+        return set(' '.join(hint.split()) for hint in
+                   re.findall(r'without\s+rowid|rowid|strict', match.group()))
+
+    def column_type(column):
+        """Return SQLite type, length and check constraint of column"""
+        check = ''
+        sqlite_type = column.type_name
+        length = column.length
+        # For INTEGER PRIMARY KEY column to become an alias for the rowid
+        # the type needs to be "INTEGER" not "INT"
+        # we fix it for other columns as well
+        if 'INT' in sqlite_type or sqlite_type == 'LONG':
+            sqlite_type = 'INTEGER'
+            length = -1
+            # Check flags for "unsigned"
+            if 'UNSIGNED' in column.flags:
+                check = dq(column.name) + '>=0'
+        # We even implement ENUM (because we can)
+        if sqlite_type == 'ENUM':
+            sqlite_type = 'TEXT'
+            if column.explicit_params:
+                check = (dq(column.name) + ' IN' +
+                         column.explicit_params)
+        return sqlite_type, length, check
+
+    def strict_type(sqlite_type):
+        """Map type to one of the types allowed in STRICT tables by the
+        affinity rules of SQLite, numeric types like DECIMAL or DATE become
+        ANY to keep the values as inserted
+        """
+        if 'INT' in sqlite_type:
+            return 'INTEGER'
+        if any(t in sqlite_type for t in ('CHAR', 'CLOB', 'TEXT')):
+            return 'TEXT'
+        if 'BLOB' in sqlite_type or 'BINARY' in sqlite_type:
+            return 'BLOB'
+        if any(t in sqlite_type for t in ('REAL', 'FLOA', 'DOUB')):
+            return 'REAL'
+        return 'ANY'
+
+    def column_size(sqlite_type, length):
+        """Estimated bytes of a column value, None if unbounded"""
+        if length > 0:
+            return length
+        if (sqlite_type == '' or
+                any(t in sqlite_type for t in ('CHAR', 'CLOB', 'TEXT', 'BLOB',
+                                               'BINARY', 'JSON'))):
+            return None
+        return 8
+
+    def table_options(tbl, primary_key, pk_column, column_types):
+        """Return the table options WITHOUT ROWID and STRICT, a rowid table
+        with a composite or non-integer key stores the key twice, in the
+        table and in its unique index
+        """
+        hints = table_hints(tbl)
+        auto_increment = any(column.auto_increment == 1
+                             for column in tbl.columns
+                             if column.name == pk_column)
+        options = []
+        if 'without rowid' in hints:
+            if not primary_key or auto_increment:
+                raise ExportSQLiteError(
+                        'Error', 'Table "%s" needs a primary key without '
+                        'AUTOINCREMENT to be created WITHOUT ROWID' % tbl.name)
+            options.append('WITHOUT ROWID')
+        elif (without_rowid_row_size > 0 and 'rowid' not in hints and
+                primary_key and not auto_increment):
+            types = dict(zip((column.name for column in tbl.columns),
+                             column_types))
+            sizes = [column_size(sqlite_type, length)
+                     for sqlite_type, length, check in column_types]
+            if ((pk_column is None or types[pk_column][0] != 'INTEGER') and
+                    None not in sizes and sum(sizes) <= without_rowid_row_size):
+                options.append('WITHOUT ROWID')
+        if strict_tables or 'strict' in hints:
+            options.append('STRICT')
+        return options
+
+    def generate_table_sql(out, db_name, schema, tbl):
         if len(tbl.columns) == 0:
             return
 
         out.write('CREATE TABLE %s%s(\n%s' % (
                   db_name, dq(tbl.name), schema_comment_format(tbl.comment)))
 
-        primary_key = [i for i in tbl.indices if i.isPrimary == 1]
+        primary_key = [i for i in tbl.indices if i.is_primary == 1]
         primary_key = primary_key[0] if len(primary_key) > 0 else None
 
         pk_column = None
         if primary_key and len(primary_key.columns) == 1:
-            pk_column = primary_key.columns[0].referencedColumn
+            pk_column = primary_key.columns[0].name
+        pk_columns = ([column.name for column in primary_key.columns]
+                      if primary_key else [])
+
+        column_types = [column_type(column) for column in tbl.columns]
+        options = table_options(tbl, primary_key, pk_column, column_types)
 
         col_comment = ''
         for i, column in enumerate(tbl.columns):
-            check, sqlite_type, flags = '', None, None
-            if column.simpleType:
-                sqlite_type = column.simpleType.name
-                flags = column.simpleType.flags
-            else:
-                sqlite_type = column.userType.name
-                flags = column.flags
-            length = column.length
-            # For INTEGER PRIMARY KEY column to become an alias for the rowid
-            # the type needs to be "INTEGER" not "INT"
-            # we fix it for other columns as well
-            if 'INT' in sqlite_type or sqlite_type == 'LONG':
-                sqlite_type = 'INTEGER'
+            sqlite_type, length, check = column_types[i]
+            # STRICT tables allow only INTEGER, REAL, TEXT, BLOB and ANY
+            if 'STRICT' in options:
+                sqlite_type = strict_type(sqlite_type)
                 length = -1
-                # Check flags for "unsigned"
-                if 'UNSIGNED' in column.flags:
-                    check = dq(column.name) + '>=0'
-            # We even implement ENUM (because we can)
-            if sqlite_type == 'ENUM':
-                sqlite_type = 'TEXT'
-                if column.datatypeExplicitParams:
-                    check = (dq(column.name) + ' IN' +
-                             column.datatypeExplicitParams)
             if i > 0:
                 out.write(',' + comment_format(col_comment) + '\n')
             out.write('  ' + dq(column.name))
@@ -214,22 +479,24 @@ def exportSQLite(cat):
 
             # Must specify single-column PKs as column-constraints for AI/rowid
             # behaviour
-            if column == pk_column:
+            if column.name == pk_column:
                 out.write(' PRIMARY KEY')
                 if primary_key.columns[0].descend == 1:
                     out.write(' DESC')
                 # Only PK columns can be AI in SQLite
-                if column.autoIncrement == 1:
+                if column.auto_increment == 1:
                     out.write(' AUTOINCREMENT')
-            # Check for NotNull
-            if column.isNotNull == 1:
+            # Check for NotNull, WITHOUT ROWID tables enforce it for the
+            # primary key, so it is written as well
+            if column.is_not_null == 1 or ('WITHOUT ROWID' in options and
+                                           column.name in pk_columns):
                 out.write(' NOT NULL')
 
             if check != '':
                 out.write(' CHECK(' + check + ')')
 
-            if column.defaultValue != '':
-                out.write(' DEFAULT ' + column.defaultValue)
+            if column.default_value != '':
+                out.write(' DEFAULT ' + column.default_value)
 
             col_comment = column.comment
 
@@ -242,14 +509,14 @@ def exportSQLite(cat):
 
         # Put non-primary, UNIQUE Keys in CREATE TABLE as well (because we can)
         for index in tbl.indices:
-            if index != primary_key and index.indexType == 'UNIQUE':
+            if index is not primary_key and index.index_type == 'UNIQUE':
                 out.write(',%s\n' % comment_format(col_comment))
                 col_comment = ''
                 if index.name != '':
                     out.write('  CONSTRAINT %s\n  ' % dq(index.name))
                 out.write('  UNIQUE(%s)' % print_index_columns(index))
 
-        for fkey in tbl.foreignKeys:
+        for fkey in tbl.foreign_keys:
             have_fkeys = 1
             out.write(',%s\n' % comment_format(col_comment))
             col_comment = ''
@@ -257,21 +524,24 @@ def exportSQLite(cat):
                 out.write('  CONSTRAINT %s\n  ' % dq(fkey.name))
             out.write('  FOREIGN KEY(%s)\n' % print_fk_columns(fkey.columns))
             out.write('    REFERENCES %s(%s)' % (
-                      dq(fkey.referencedTable.name),
-                      print_fk_columns(fkey.referencedColumns)))
-            if fkey.deleteRule in ['RESTRICT', 'CASCADE', 'SET NULL']:
-                out.write('\n    ON DELETE ' + fkey.deleteRule)
-            if fkey.updateRule in ['RESTRICT', 'CASCADE', 'SET NULL']:
-                out.write('\n    ON UPDATE ' + fkey.updateRule)
+                      dq(fkey.referenced_table),
+                      print_fk_columns(fkey.referenced_columns)))
+            if fkey.delete_rule in ['RESTRICT', 'CASCADE', 'SET NULL']:
+                out.write('\n    ON DELETE ' + fkey.delete_rule)
+            if fkey.update_rule in ['RESTRICT', 'CASCADE', 'SET NULL']:
+                out.write('\n    ON UPDATE ' + fkey.update_rule)
             if is_deferred(fkey):
                 out.write(' DEFERRABLE INITIALLY DEFERRED')
 
-        out.write(comment_format(col_comment) + '\n);\n')
+        out.write(comment_format(col_comment) + '\n)')
+        if options:
+            out.write(' ' + ', '.join(options))
+        out.write(';\n')
 
         # CREATE INDEX statements for all non-primary, non-unique, non-foreign
         # indexes
         for i, index in enumerate(tbl.indices):
-            if index.indexType == 'INDEX':
+            if index.index_type == 'INDEX':
                 index_name = tbl.name + '.' + index.name
                 if index.name == '':
                     index_name = tbl.name + '.index' + i
@@ -282,74 +552,279 @@ def exportSQLite(cat):
                           print_index_columns(index)))
 
         # Write the INSERTS (currently always)
-        for insert in tbl.inserts().splitlines():
-            columns_values = ''
-            insert_start = 'insert into `%s`.`%s` (' % (schema.name, tbl.name)
-            if insert[0:len(insert_start)].lower() == insert_start.lower():
-                columns_values = insert[len(insert_start):]
-            else:
+        write_inserts(out, tbl, parse_inserts(schema, tbl))
+
+    def tokenize_mysql(text):
+        """Split MySQL statements into (kind, text) tokens, whitespace and
+        character set introducers like _utf8mb4'...' are left out
+        """
+        pos = 0
+        while pos < len(text):
+            match = mysql_token_re.match(text, pos)
+            if match is None:
+                raise ExportSQLiteError(
+                        'Error', 'Unrecognized character in insert: %r' %
+                        text[pos:pos + 20])
+            pos = match.end()
+            if match.lastgroup not in ('space', 'introducer'):
+                yield match.lastgroup, match.group()
+
+    def mysql_string_value(token):
+        """Decode a quoted MySQL string literal"""
+        quote = token[0]
+        body = token[1:-1].replace(quote + quote, quote)
+        return re.sub(r'\\(.)',
+                      lambda m: mysql_escapes.get(m.group(1), m.group(1)),
+                      body, flags=re.DOTALL)
+
+    def sqlite_string(value):
+        """Quote string as SQLite literal, control characters are written by
+        char() to keep every row on one line
+        """
+        parts = re.split(r'([\x00-\x08\x0a-\x1f])', value)
+        literals = []
+        for i, part in enumerate(parts):
+            if i % 2:
+                literals.append('char(%d)' % ord(part))
+            elif part != '' or len(parts) == 1:
+                literals.append("'" + part.replace("'", "''") + "'")
+        return '||'.join(literals)
+
+    def sqlite_value_token(kind, text):
+        if kind == 'string':
+            return sqlite_string(mysql_string_value(text))
+        if kind == 'ident':
+            return dq(text[1:-1].replace('``', '`'))
+        if kind == 'hex' and text[:2] == '0x':
+            digits = text[2:]
+            return "X'%s'" % ('0' * (len(digits) % 2) + digits)
+        if kind == 'bit':
+            bits = text[2:-1] if text[1] == "'" else text[2:]
+            return str(int(bits or '0', 2))
+        return text
+
+    def parse_inserts(schema, tbl):
+        """Parse the INSERT statements of the model into a list of
+        (column names, rows), rows are lists of SQLite value expressions
+        """
+        tokens = list(tokenize_mysql(tbl.inserts))
+        column_names = set(column.name for column in tbl.columns)
+        inserts = []
+        pos = 0
+
+        def expect(kind, text=None, error='Unrecognized SQL in insert'):
+            nonlocal pos
+            if (pos >= len(tokens) or tokens[pos][0] != kind or
+                    (text is not None and tokens[pos][1].upper() != text)):
+                raise ExportSQLiteError('Error', error)
+            pos += 1
+            return tokens[pos - 1][1]
+
+        def accept(kind, text):
+            nonlocal pos
+            if (pos < len(tokens) and tokens[pos][0] == kind and
+                    tokens[pos][1].upper() == text):
+                pos += 1
+                return True
+            return False
+
+        while pos < len(tokens):
+            if accept('symbol', ';'):
+                continue
+            expect('word', 'INSERT', 'Unrecognized command in insert')
+            accept('word', 'INTO')
+            name = expect('ident', None, 'Unrecognized command in insert')
+            if accept('symbol', '.'):
+                if name[1:-1] != schema.name:
+                    raise ExportSQLiteError(
+                            'Error', 'Unrecognized command in insert')
+                name = expect('ident', None, 'Unrecognized command in insert')
+            if name[1:-1].replace('``', '`') != tbl.name:
                 raise ExportSQLiteError(
                         'Error', 'Unrecognized command in insert')
-            last_column = 0
-            for i, column in enumerate(tbl.columns):
-                column_name = '`' + column.name + '`'
-                if columns_values[0:len(column_name)] == column_name:
-                    columns_values = columns_values[len(column_name):]
-                    if columns_values[0:1] == ')':
-                        columns_values = columns_values[1:]
-                        last_column = i
-                        break
-                    else:
-                        if columns_values[0:2] == ', ':
-                            columns_values = columns_values[2:]
-                        else:
-                            raise ExportSQLiteError(
-                                    'Error',
-                                    'Unrecognized character in column list')
-                else:
+
+            columns = []
+            expect('symbol', '(', 'Unrecognized character in column list')
+            while True:
+                column = expect('ident', None, 'Unrecognized column in inserts')
+                column = column[1:-1].replace('``', '`')
+                if column not in column_names:
                     raise ExportSQLiteError(
                             'Error', 'Unrecognized column in inserts')
+                columns.append(column)
+                if accept('symbol', ')'):
+                    break
+                expect('symbol', ',', 'Unrecognized character in column list')
+
+            expect('word', 'VALUES')
+            rows = []
+            while True:
+                expect('symbol', '(')
+                row = []
+                value = []
+                last_kind = None
+                depth = 0
+                while True:
+                    if pos >= len(tokens):
+                        raise ExportSQLiteError(
+                                'Error', 'Unrecognized SQL in insert')
+                    kind, text = tokens[pos]
+                    pos += 1
+                    if kind == 'symbol' and text in ',)' and depth == 0:
+                        row.append(''.join(value))
+                        value = []
+                        last_kind = None
+                        if text == ')':
+                            break
+                        continue
+                    if kind == 'symbol' and text == '(':
+                        depth += 1
+                    elif kind == 'symbol' and text == ')':
+                        depth -= 1
+                    # separate words only, e.g. "NOT NULL", but "-1", "lower('A')"
+                    if kind != 'symbol' and last_kind not in (None, 'symbol'):
+                        value.append(' ')
+                    value.append(sqlite_value_token(kind, text))
+                    last_kind = kind
+                if len(row) != len(columns):
+                    raise ExportSQLiteError(
+                            'Error', 'Number of values does not match columns in insert')
+                rows.append(row)
+                if not accept('symbol', ','):
+                    break
+            inserts.append((columns, rows))
+        return inserts
 
-            out.write('INSERT INTO %s(' % dq(tbl.name))
-            for i in range(last_column + 1):
-                if i > 0:
-                    out.write(',')
-                out.write(dq(tbl.columns[i].name))
-
-            if columns_values[0:9].lower() != ' values (':
+    def write_inserts(out, tbl, inserts):
+        """Write rows as multi-row INSERTs, consecutive rows with the same
+        columns are put together
+        """
+        batch_columns, batch = None, []
+
+        def write_batch():
+            if not batch:
+                return
+            out.write('INSERT INTO %s(%s) VALUES\n' % (
+                      dq(tbl.name), ','.join(dq(c) for c in batch_columns)))
+            out.write(',\n'.join('(' + ','.join(row) + ')' for row in batch))
+            out.write(';\n')
+
+        for columns, rows in inserts:
+            for row in rows:
+                if columns != batch_columns or len(batch) >= insert_batch_size:
+                    write_batch()
+                    batch_columns, batch = columns, []
+                batch.append(row)
+        write_batch()
+
+    def table_references(tables, respect_deferredness):
+        """Build the FK dependency graph once, return for every table name the
+        names of the tables referencing it. Self references, references to
+        other schemata and, if respect_deferredness is set, deferred FKs are
+        left out
+        """
+        referencing = {tbl.name: [] for tbl in tables}
+        for tbl in tables:
+            referenced = set()
+            for fkey in tbl.foreign_keys:
+                name = fkey.referenced_table
+                if (name in referencing and name != tbl.name and
+                        name not in referenced and
+                        not (respect_deferredness and is_deferred(fkey))):
+                    referenced.add(name)
+                    referencing[name].append(tbl.name)
+        return referencing
+
+    def topological_order(tables, referencing):
+        """Kahn's algorithm, return ordered table names and the names of
+        tables which could not be ordered because of circular references
+        """
+        in_degree = {tbl.name: 0 for tbl in tables}
+        for names in referencing.values():
+            for name in names:
+                in_degree[name] += 1
+
+        queue = deque(tbl.name for tbl in tables if in_degree[tbl.name] == 0)
+        ordered = []
+        while queue:
+            name = queue.popleft()
+            ordered.append(name)
+            for referencing_name in referencing[name]:
+                in_degree[referencing_name] -= 1
+                if in_degree[referencing_name] == 0:
+                    queue.append(referencing_name)
+
+        unordered = [tbl.name for tbl in tables if in_degree[tbl.name] > 0]
+        return ordered, unordered
+
+    def circular_references(names, referencing):
+        """Tarjan's algorithm (iterative), return the strongly connected
+        components with more than one table of the graph restricted to names
+        """
+        names = set(names)
+        index = {}
+        low_link = {}
+        stack = []
+        on_stack = set()
+        components = []
+        for start in sorted(names):
+            if start in index:
+                continue
+            work = [(start, iter(referencing[start]))]
+            index[start] = low_link[start] = len(index)
+            stack.append(start)
+            on_stack.add(start)
+            while work:
+                name, successors = work[-1]
+                for successor in successors:
+                    if successor not in names:
+                        continue
+                    if successor not in index:
+                        index[successor] = low_link[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(referencing[successor])))
+                        break
+                    elif successor in on_stack:
+                        low_link[name] = min(low_link[name], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low_link[parent] = min(low_link[parent], low_link[name])
+                    if low_link[name] == index[name]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == name:
+                                break
+                        if len(component) > 1:
+                            components.append(sorted(component))
+        return components
+
+    def order_tables(tables):
+        """Find a valid table order for inserts from FK constraints in
+        O(tables + foreign keys)
+        """
+        # Try treating deferred keys like non-deferred keys first for ordering
+        ordered, unordered = topological_order(
+            tables, table_references(tables, False))
+        if unordered:
+            # Now try harder (leave out deferred keys from determining an order)
+            referencing = table_references(tables, True)
+            ordered, unordered = topological_order(tables, referencing)
+            if unordered:
                 raise ExportSQLiteError(
-                        'Error', 'Unrecognized SQL in insert')
-            columns_values = columns_values[9:]
+                    'Error',
+                    'Found circular reference in tables: %s, please remove or use "defer" '
+                    'in comment of one of the circular referencing foreign keys!' % '; '.join(
+                        ', '.join(component) for component in
+                        circular_references(unordered, referencing)))
 
-            out.write(') VALUES(')
-            out.write(columns_values.replace("\\'", "''"))
-            out.write('\n')
-
-    def order_tables(out, db_name, schema, unordered, respect_deferredness):
-        if len(unordered) == 0:
-            return
-        have_ordered = False
-        for tbl in list(unordered.values()):
-            has_forward_reference = False
-            for fkey in tbl.foreignKeys:
-                if (fkey.referencedTable.name in unordered and
-                        fkey.referencedTable.name != tbl.name and not (
-                            respect_deferredness and is_deferred(fkey))):
-                    has_forward_reference = True
-                    break
-            if not has_forward_reference:
-                export_table(out, db_name, schema, tbl)
-                del unordered[tbl.name]
-                have_ordered = True
-
-        if not have_ordered and respect_deferredness:
-            tableNames = []
-            for tbl in list(unordered.values()):
-                tableNames.append( tbl.name )
-            raise ExportSQLiteError(
-                'Error', 
-                'Found circular reference in tables: %s, please remove or use "defer" '
-                'in comment of one of the circular referencing foreign keys!' % ', '.join(tableNames))
+        tables_by_name = {tbl.name: tbl for tbl in tables}
+        return [tables_by_name[name] for name in ordered]
 
     def export_schema(out, schema, is_main_schema):
         if len(schema.tables) == 0:
@@ -366,17 +841,7 @@ def exportSQLite(cat):
                     dq(schema.name)))
         out.write('BEGIN;\n')
 
-        # Find a valid table order for inserts from FK constraints
-        unordered = {t.name: t for t in schema.tables}
-
-        # Try treating deferred keys like non-deferred keys first for ordering
-        order_tables(out, db_name, schema, unordered, False)
-        # Now try harder (leave out deferred keys from determining an order)
-        order_tables(out, db_name, schema, unordered, True)
-
-        # Loop through all remaining tables, if any. Have circular FK refs.
-        # How to handle?
-        for tbl in unordered.values():
+        for tbl in order_tables(schema.tables):
             export_table(out, db_name, schema, tbl)
 
         out.write('COMMIT;\n')
@@ -386,7 +851,7 @@ def exportSQLite(cat):
         for i, column in enumerate(index.columns):
             if i > 0:
                 s += ','
-            s += dq(column.referencedColumn.name)
+            s += dq(column.name)
             if column.descend == 1:
                 s += ' DESC'
         return s
@@ -396,7 +861,7 @@ def exportSQLite(cat):
         for i, column in enumerate(columns):
             if i > 0:
                 s += ','
-            s += dq(column.name)
+            s += dq(column)
         return s
 
     def dq(ident):
@@ -446,40 +911,53 @@ def exportSQLite(cat):
             # Single line
             return '-- %s' % body
 
-    if not validate_for_sqlite_export(cat):
+    schemata = snapshot_catalog(cat)
+    if not validate_for_sqlite_export(schemata):
         return 1
 
-    out = StringIO()
-    out.write(info_format(
-                'Creator',
-                'MySQL Workbench %d.%d.%d/ExportSQLite Plugin %s\n' % (
-                    grt.root.wb.info.version.majorNumber,
-                    grt.root.wb.info.version.minorNumber,
-                    grt.root.wb.info.version.releaseNumber,
-                    ModuleInfo.version)))
-    out.write(info_format('Author', grt.root.wb.doc.info.author))
-    out.write(info_format('Caption', grt.root.wb.doc.info.caption))
-    out.write(info_format('Project', grt.root.wb.doc.info.project))
-    out.write(info_format('Changed', grt.root.wb.doc.info.dateChanged))
-    out.write(info_format('Created', grt.root.wb.doc.info.dateCreated))
-    out.write(info_format('Description', grt.root.wb.doc.info.description))
-
-    out.write('PRAGMA foreign_keys = OFF;\n')
-
-    # Loop over all catalogs in schema, find main schema main schema is first
-    # nonempty schema or nonempty schema named "main"
+    exported_tables = set()
+    # The script is streamed to a file, it may be too large for the editor.
+    # The file is removed, when the wizard has been closed
+    out = tempfile.NamedTemporaryFile('w', encoding='utf-8', delete=False,
+                                      prefix='ExportSQLite_', suffix='.sql')
+    sql_path = out.name
     try:
-        for schema in [(s, s.name == 'main') for s in cat.schemata]:
-            export_schema(out, schema[0], schema[1])
-    except ExportSQLiteError as e:
-        mforms.Utilities.show_error( 'Error in export schema', e.message, 'OK','','')
-        return 1
-
-    sql_text = out.getvalue()
-    out.close()
-
-    wizard = ExportSQLiteWizard(sql_text)
-    wizard.run()
+        out.write(info_format(
+                    'Creator',
+                    'MySQL Workbench %d.%d.%d/ExportSQLite Plugin %s\n' % (
+                        grt.root.wb.info.version.majorNumber,
+                        grt.root.wb.info.version.minorNumber,
+                        grt.root.wb.info.version.releaseNumber,
+                        ModuleInfo.version)))
+        out.write(info_format('Author', grt.root.wb.doc.info.author))
+        out.write(info_format('Caption', grt.root.wb.doc.info.caption))
+        out.write(info_format('Project', grt.root.wb.doc.info.project))
+        out.write(info_format('Changed', grt.root.wb.doc.info.dateChanged))
+        out.write(info_format('Created', grt.root.wb.doc.info.dateCreated))
+        out.write(info_format('Description', grt.root.wb.doc.info.description))
+
+        out.write('PRAGMA foreign_keys = OFF;\n')
+
+        # Loop over all catalogs in schema, find main schema main schema is
+        # first nonempty schema or nonempty schema named "main"
+        try:
+            for schema in [(s, s.name == 'main') for s in schemata]:
+                export_schema(out, schema[0], schema[1])
+        except ExportSQLiteError as e:
+            mforms.Utilities.show_error( 'Error in export schema', e.message, 'OK','','')
+            return 1
+        finally:
+            out.close()
+
+        # forget tables, which do not exist anymore
+        for key in set(table_sql_cache) - exported_tables:
+            del table_sql_cache[key]
+
+        wizard = ExportSQLiteWizard(sql_path)
+        wizard.run()
+    finally:
+        out.close()
+        os.remove(sql_path)
 
     return 0
 
@@ -492,9 +970,21 @@ class ExportSQLiteError(Exception):
         return repr(self.typ) + ': ' + repr(self.message)
 
 class ExportSQLiteWizard_PreviewPage(WizardPage):
-    def __init__(self, owner, sql_text):
+    def __init__(self, owner, sql_path):
         WizardPage.__init__(self, owner, 'Review Generated Script')
 
+        # Large scripts are shown as read only preview, the file is used
+        # instead of the editor text
+        self.sql_path = sql_path
+        with open(sql_path, 'r', encoding='utf-8') as f:
+            sql_text = f.read(preview_chars + 1)
+        self.is_preview = len(sql_text) > preview_chars
+        if self.is_preview:
+            sql_text = (sql_text[:preview_chars] +
+                        '\n-- ... preview truncated, the complete script '
+                        '(%d bytes) is used from "%s"\n' % (
+                            os.path.getsize(sql_path), sql_path))
+
         self.save_button = mforms.newButton()
         self.save_button.enable_internal_padding(True)
         self.save_button.set_text('Save to File...')
@@ -513,9 +1003,21 @@ class ExportSQLiteWizard_PreviewPage(WizardPage):
         self.create_db_button.set_tooltip('Create/Update SQLite Database from SQL statements.')
         self.create_db_button.add_clicked_callback(self.create_db_clicked)
 
+        self.in_place_check = mforms.newCheckBox()
+        self.in_place_check.set_text('Update in place')
+        self.in_place_check.set_tooltip('Update indexes, views and triggers in the existing database, '
+                                        'if no table has changed.')
+
+        self.profile_check = mforms.newCheckBox()
+        self.profile_check.set_text('Profile')
+        self.profile_check.set_tooltip('Write cProfile statistics and allocation reports of each update phase '
+                                       'next to the database log.')
+
         self.sql_text = mforms.newCodeEditor()
         self.sql_text.set_language(mforms.LanguageMySQL)
         self.sql_text.set_text(sql_text)
+        if self.is_preview:
+            self.sql_text.set_features(mforms.FeatureReadOnly, True)
 
         self.log_text = mforms.newCodeEditor()
         self.log_text.set_language(mforms.LanguageJson)
@@ -533,6 +1035,8 @@ class ExportSQLiteWizard_PreviewPage(WizardPage):
         button_box.add(self.save_button, False, True)
         button_box.add(self.copy_button, False, True)
         button_box.add(self.create_db_button, False, True)
+        button_box.add(self.in_place_check, False, True)
+        button_box.add(self.profile_check, False, True)
 
         self.content.add(self.sql_text, True, True)
         self.content.add(button_box, False, False)
@@ -545,10 +1049,12 @@ class ExportSQLiteWizard_PreviewPage(WizardPage):
         file_chooser.set_extensions('SQL Files (*.sql)|*.sql', 'sql')
         if file_chooser.run_modal() == mforms.ResultOk:
             path = file_chooser.get_path()
-            text = self.sql_text.get_text(False)
             try:
-                with open(path, 'w+') as f:
-                    f.write(text)
+                if self.is_preview:
+                    shutil.copyfile(self.sql_path, path)
+                else:
+                    with open(path, 'w+') as f:
+                        f.write(self.sql_text.get_text(False))
             except IOError as e:
                 mforms.Utilities.show_error(
                     'Save to File',
@@ -556,7 +1062,11 @@ class ExportSQLiteWizard_PreviewPage(WizardPage):
                     'OK','','')
 
     def copy_clicked(self):
-        mforms.Utilities.set_clipboard_text(self.sql_text.get_text(False))
+        if self.is_preview:
+            with open(self.sql_path, 'r', encoding='utf-8') as f:
+                mforms.Utilities.set_clipboard_text(f.read())
+        else:
+            mforms.Utilities.set_clipboard_text(self.sql_text.get_text(False))
 
     def create_db_clicked(self):
         modelName = ''
@@ -571,20 +1081,21 @@ class ExportSQLiteWizard_PreviewPage(WizardPage):
             return
         
         path = file_chooser.get_path()
-        sql = self.sql_text.get_text(False)
                 
-        logBuffer = StringIO()
-        ch = logging.StreamHandler(logBuffer)
-        ch.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S')
-        ch.setFormatter(formatter)
-        
-        currentDir = os.getcwd()
+        # only the latest records are shown, the complete log is written to
+        # the log file of the database
+        log_buffer = SQLiteDbUpdater.RingBufferHandler(log_buffer_size)
+
+        updater = None
         logger = None
         try:
-            updater = SQLiteDbUpdater.SQLiteDbUpdater( path, sql )
-            logger = updater.enableLogging()
-            logger.addHandler(ch)
+            if self.is_preview:
+                updater = SQLiteDbUpdater.SQLiteDbUpdater.fromSqlFile( path, self.sql_path )
+            else:
+                updater = SQLiteDbUpdater.SQLiteDbUpdater( path, self.sql_text.get_text(False) )
+            updater.inPlace = self.in_place_check.get_active()
+            updater.profile = self.profile_check.get_active()
+            logger = updater.enableLogging(log_buffer)
             updater.update()
         except Exception as e:
             excType, value, traceback = sys.exc_info()
@@ -593,19 +1104,20 @@ class ExportSQLiteWizard_PreviewPage(WizardPage):
             mforms.Utilities.show_error( 'Create/Update SQLite database', errString, 'OK','','')
             if logger:
                 logger.error( 'Error in "Create/Update SQLite database": %s' % errString )
+        finally:
+            if updater:
+                updater.disableLogging()
 
-        self.log_text.set_text( logBuffer.getvalue() )
-        logBuffer.close()
-        os.chdir( currentDir )
+        self.log_text.set_text( log_buffer.getText() )
 
 class ExportSQLiteWizard(WizardForm):
-    def __init__(self, sql_text):
+    def __init__(self, sql_path):
         WizardForm.__init__(self, None)
 
         self.set_name('sqlite_export_wizard')
         self.set_title('SQLite Export Wizard')
 
-        self.preview_page = ExportSQLiteWizard_PreviewPage(self, sql_text)
+        self.preview_page = ExportSQLiteWizard_PreviewPage(self, sql_path)
         self.add_page(self.preview_page)
 
 # Uncomment this, if you want to test/run/debug at MySQL Workbench -> Scripting